@@ -12,11 +12,18 @@ Complete foundation with all necessary imports and setup
 """
 
 import os
+import sys
+import socket
+import json
 import asyncio
 import traceback
-import requests
 import re
+import random
+import heapq
+import zlib
 import aiohttp
+from collections import deque, OrderedDict
+from urllib.parse import urlsplit, parse_qsl, urlencode
 from datetime import datetime, timedelta, time as datetime_time
 from datetime import datetime, timedelta, time, timezone
 from dotenv import load_dotenv
@@ -42,6 +49,7 @@ from telegram.ext import (
 )
 
 from telegram.warnings import PTBUserWarning  # ← Add this
+from telegram.error import Conflict
 
 
 
@@ -51,7 +59,7 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 # PostgreSQL imports
 import psycopg2
 from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import aiohttp
 
 # -------------------------
@@ -96,6 +104,29 @@ FWGS_STOCKSTATUS_URL = (
 FWGS_LOCATION_URL = "https://www.finewineandgoodspirits.com/ccstore/v1/locations/{store}"
 PRODUCT_BASE_URL = "https://www.finewineandgoodspirits.com/ccstore/v1/products"
 
+# FWGS API rate limiting - one budget shared by every job and handler
+FWGS_RATE_START = 20.0          # requests/sec at startup
+FWGS_RATE_MIN = 2.0
+FWGS_RATE_MAX = 60.0
+FWGS_RATE_STEP = 1.0            # additive increase (req/s) after a clean streak
+FWGS_CONCURRENCY_START = 15     # requests in flight at startup
+FWGS_CONCURRENCY_MIN = 2
+FWGS_CONCURRENCY_MAX = 40
+FWGS_BACKOFF_FAIL_RATE = 0.05   # back off when >5% of recent requests fail
+FWGS_BACKOFF_COOLDOWN = 2.0     # seconds between multiplicative decreases
+FWGS_BREAKER_WINDOW = 20        # recent outcomes per endpoint family the breaker looks at
+FWGS_BREAKER_MIN_CALLS = 6      # don't trip on a handful of requests
+FWGS_BREAKER_FAIL_RATE = 0.5    # open when half the recent requests fail
+FWGS_BREAKER_OPEN_SECONDS = 30.0    # first open period, doubles on each failed recovery
+FWGS_BREAKER_OPEN_MAX = 300.0
+FWGS_BREAKER_PROBES = 3         # successful probes needed to close again (one in flight at a time)
+
+# Process role: "bot" (Telegram front end), "worker" (monitors, inventory, scheduled jobs)
+# or "all" (both in one process). Set by the first CLI argument (see Procfile) or BOT_ROLE.
+BOT_ROLE = (sys.argv[1] if len(sys.argv) > 1 else os.getenv("BOT_ROLE", "all")).lower()
+if BOT_ROLE not in ("all", "bot", "worker"):
+    raise SystemExit(f"Unknown role {BOT_ROLE!r} - expected bot, worker or all")
+
 # Business hours for notifications (optional - can adjust later)
 from datetime import time
 BUSINESS_START = time(13, 0)      # 08:00 local
@@ -253,6 +284,15 @@ def init_db():
             );
         """)
         
+        # Last values of the extra monitor detectors (migration)
+        cur.execute("""
+            ALTER TABLE product_cache
+            ADD COLUMN IF NOT EXISTS price TEXT,
+            ADD COLUMN IF NOT EXISTS limit_per_order TEXT,
+            ADD COLUMN IF NOT EXISTS highly_allocated TEXT,
+            ADD COLUMN IF NOT EXISTS lottery TEXT;
+        """)
+        
         # PRODUCT_QUANTITY_CACHE
         cur.execute("""
             CREATE TABLE IF NOT EXISTS product_quantity_cache (
@@ -264,6 +304,57 @@ def init_db():
             );
         """)
         
+        # PRODUCT_CHANGE_LOG - when active/category/stock changes were seen (feeds learned poll intervals)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS product_change_log (
+                id BIGSERIAL PRIMARY KEY,
+                product_id TEXT NOT NULL,
+                change_type TEXT NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_product_change_log_changed_at 
+            ON product_change_log(changed_at);
+        """)
+        
+        # MONITOR_WORKERS - live sharded monitor processes (heartbeat)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS monitor_workers (
+                worker_id TEXT PRIMARY KEY,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        
+        # GLOBAL_REPORTS - daily Excel reports, so /lastreport works on the bot role too
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS global_reports (
+                report_date DATE PRIMARY KEY,
+                filename TEXT NOT NULL,
+                content BYTEA NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        
+        # BOT_JOBS - requests from the bot role to the worker role (see enqueue_bot_job)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS bot_jobs (
+                id BIGSERIAL PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                claimed_at TIMESTAMP,
+                claimed_by TEXT
+            );
+        """)
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_bot_jobs_unclaimed 
+            ON bot_jobs(id) WHERE claimed_at IS NULL;
+        """)
+        
         # SUBSCRIPTIONS
         cur.execute("""
             CREATE TABLE IF NOT EXISTS subscriptions (
@@ -368,82 +459,614 @@ def normalize_for_comparison(val, col_name):
         return val_str
     return str(val).strip()
 
+# ============================================================
+# SHARED FWGS HTTP CLIENT
+# ============================================================
+# One long-lived aiohttp session for every FWGS call (monitors, reports,
+# handlers). Keeps connections alive and caches DNS so we don't pay TCP/TLS
+# handshakes to finewineandgoodspirits.com on every cycle.
+http_session = None
+
+FWGS_HEADERS = {"User-Agent": "Mozilla/5.0", "Accept": "application/json"}
+
+# Per-endpoint timeouts
+FWGS_TIMEOUTS = {
+    "product": aiohttp.ClientTimeout(total=10),                      # Full product documents
+    "fields": aiohttp.ClientTimeout(total=3, connect=1, sock_read=2),  # ?fields= lightweight polls
+    "bulk": aiohttp.ClientTimeout(total=10, connect=2, sock_read=8),   # products collection, many IDs per request
+    "stock": aiohttp.ClientTimeout(total=10),
+    "location": aiohttp.ClientTimeout(total=10),
+}
+
+def init_http_session():
+    """Create the shared FWGS HTTP session (call from inside the event loop)."""
+    global http_session
+    connector = aiohttp.TCPConnector(
+        limit=40,
+        limit_per_host=30,
+        ttl_dns_cache=600,
+        keepalive_timeout=60,
+        enable_cleanup_closed=True
+    )
+    http_session = aiohttp.ClientSession(
+        connector=connector,
+        headers=FWGS_HEADERS,
+        timeout=FWGS_TIMEOUTS["product"]
+    )
+    log("✅ FWGS HTTP client created")
+
+def get_http_session():
+    """Get the shared FWGS HTTP session."""
+    if http_session is None or http_session.closed:
+        init_http_session()
+    return http_session
+
+async def close_http_session():
+    """Close the shared FWGS HTTP session (call on shutdown)."""
+    global http_session
+    if http_session and not http_session.closed:
+        await http_session.close()
+        log("✅ FWGS HTTP client closed")
+    http_session = None
+
+# ============================================================
+# ADAPTIVE RATE LIMITER
+# ============================================================
+
+class AdaptiveRateLimiter:
+    """
+    Process-wide token bucket + AIMD concurrency limit for FWGS API traffic.
+    - Additive increase: after a clean streak, +FWGS_RATE_STEP req/s and +1 slot
+    - Multiplicative decrease: on 429s (or >5% 5xx/timeouts), halve the rate and cut slots by 30%
+    So the monitors, reports and handlers together stay at the highest rate the API accepts.
+    """
+
+    def __init__(self, rate, min_rate, max_rate, concurrency, min_concurrency, max_concurrency):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.tokens = 1.0
+        self.last_refill = None
+        self.in_flight = 0
+        self.total_requests = 0
+        self.outcomes = deque(maxlen=200)  # Recent "ok"/"throttled"/"server_error"/"timeout"/"error"
+        self.decision_window = deque(maxlen=50)  # Outcomes since the last decrease (AIMD decisions)
+        self.latencies = deque(maxlen=500)  # Recent on-the-wire request latencies (seconds)
+        self._waiters = deque()
+        self._clean_streak = 0
+        self._last_decrease = 0.0
+
+    def _now(self):
+        return asyncio.get_running_loop().time()
+
+    def _refill(self):
+        now = self._now()
+        if self.last_refill is not None:
+            burst = max(self.rate, 1.0)  # Allow at most ~1 second of burst
+            self.tokens = min(burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _wake_waiters(self):
+        """Hand free concurrency slots to queued callers (FIFO)."""
+        while self._waiters and self.in_flight < self.concurrency:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.in_flight += 1
+                fut.set_result(None)
+
+    async def acquire(self):
+        """Wait for a concurrency slot and a rate token."""
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut  # Slot is handed over by _wake_waiters()
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self.in_flight -= 1
+                    self._wake_waiters()
+                raise
+        
+        try:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        except asyncio.CancelledError:
+            self.in_flight -= 1
+            self._wake_waiters()
+            raise
+
+    def set_share(self, share):
+        """Scale the ceilings to a share of the global FWGS budget (sharded monitor workers)."""
+        self.max_rate = max(FWGS_RATE_MIN, FWGS_RATE_MAX * share)
+        self.max_concurrency = max(FWGS_CONCURRENCY_MIN, round(FWGS_CONCURRENCY_MAX * share))
+        self.rate = min(self.rate, self.max_rate)
+        self.concurrency = min(self.concurrency, self.max_concurrency)
+
+    def release(self, outcome, latency=None):
+        """Free the slot and feed the request outcome into the AIMD controller."""
+        self.in_flight -= 1
+        if outcome != "cancelled":  # Our own cancellations say nothing about the API
+            self.total_requests += 1
+            self.outcomes.append(outcome)
+            self.decision_window.append(outcome)
+            if latency is not None:
+                self.latencies.append(latency)
+            if outcome == "ok":
+                self._on_success()
+            else:
+                self._on_failure(outcome)
+        self._wake_waiters()
+
+    def failure_rate(self, last=50):
+        recent = list(self.outcomes)[-last:]
+        if not recent:
+            return 0.0
+        return sum(1 for o in recent if o != "ok") / len(recent)
+
+    def _on_success(self):
+        self._clean_streak += 1
+        if self._clean_streak < max(10, self.concurrency):
+            return
+        if self._now() - self._last_decrease < FWGS_BACKOFF_COOLDOWN:
+            return
+        self._clean_streak = 0
+        self.rate = min(self.max_rate, self.rate + FWGS_RATE_STEP)
+        # Only grow concurrency if we're actually using the slots we have
+        if self.in_flight >= self.concurrency - 1 or self._waiters:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+    def _on_failure(self, outcome):
+        self._clean_streak = 0
+        # Judge the failure rate on a full window of outcomes seen since the last cut, so the
+        # failures behind one cut can't trigger the next - at most one cut per window
+        window = self.decision_window
+        enough_samples = len(window) == window.maxlen
+        window_failure_rate = sum(1 for o in window if o != "ok") / len(window)
+        if outcome == "throttled" or (enough_samples and window_failure_rate > FWGS_BACKOFF_FAIL_RATE):
+            self._decrease(outcome)
+
+    def _decrease(self, reason):
+        now = self._now()
+        if now - self._last_decrease < FWGS_BACKOFF_COOLDOWN:
+            return
+        self._last_decrease = now
+        self.decision_window.clear()
+        old_rate, old_conc = self.rate, self.concurrency
+        self.rate = max(self.min_rate, self.rate * 0.5)
+        self.concurrency = max(self.min_concurrency, int(self.concurrency * 0.7))
+        if (old_rate, old_conc) != (self.rate, self.concurrency):
+            log(
+                f"🐢 FWGS backoff ({reason}): rate {old_rate:.1f}→{self.rate:.1f} req/s, "
+                f"concurrency {old_conc}→{self.concurrency}"
+            )
+
+    def stats(self):
+        return (
+            f"rate={self.rate:.1f} req/s, concurrency={self.concurrency}, in_flight={self.in_flight}, "
+            f"recent failures={self.failure_rate() * 100:.1f}%, total={self.total_requests}, "
+            f"latency {latency_summary(self.latencies)}"
+        )
+
+
+fwgs_limiter = AdaptiveRateLimiter(
+    FWGS_RATE_START, FWGS_RATE_MIN, FWGS_RATE_MAX,
+    FWGS_CONCURRENCY_START, FWGS_CONCURRENCY_MIN, FWGS_CONCURRENCY_MAX
+)
+
+def classify_fwgs_status(status_code):
+    """Map an HTTP status to a rate limiter outcome."""
+    if status_code == 429:
+        return "throttled"
+    if status_code >= 500:
+        return "server_error"
+    return "ok"  # 2xx/3xx/404 - the API answered normally
+
+# ============================================================
+# CIRCUIT BREAKER
+# ============================================================
+class FWGSUnavailable(Exception):
+    """Raised instead of sending a request while an endpoint family's breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open -> half-open breaker for one FWGS endpoint family.
+    closed:    requests pass; opens when the recent failure rate crosses FWGS_BREAKER_FAIL_RATE.
+    open:      requests fail fast with FWGSUnavailable until the open period ends.
+    half-open: one probe at a time; FWGS_BREAKER_PROBES successes close it,
+               any failure re-opens it for twice as long.
+    """
+    
+    def __init__(self, name):
+        self.name = name
+        self.state = "closed"
+        self.outcomes = deque(maxlen=FWGS_BREAKER_WINDOW)  # True = failure
+        self.open_seconds = FWGS_BREAKER_OPEN_SECONDS
+        self.opened_until = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.rejected = 0
+        self.trips = 0
+    
+    def is_open(self):
+        """True while requests would be rejected (open and not yet due for a probe)."""
+        return self.state == "open" and asyncio.get_running_loop().time() < self.opened_until
+    
+    def before_request(self):
+        """Admit a request or raise FWGSUnavailable."""
+        if self.state == "open":
+            if asyncio.get_running_loop().time() < self.opened_until:
+                self.rejected += 1
+                raise FWGSUnavailable(f"FWGS {self.name} API unavailable (circuit open)")
+            self.state = "half-open"
+            self.probes_in_flight = 0
+            self.probe_successes = 0
+            log(f"🟡 FWGS {self.name} circuit half-open, probing")
+        
+        if self.state == "half-open":
+            if self.probes_in_flight >= 1:
+                self.rejected += 1
+                raise FWGSUnavailable(f"FWGS {self.name} API unavailable (probing)")
+            self.probes_in_flight += 1
+    
+    def after_request(self, outcome):
+        """Record a finished request (same outcomes as AdaptiveRateLimiter.release)."""
+        if self.state == "half-open":
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            if outcome == "cancelled":
+                return
+            if outcome != "ok":
+                self.open_seconds = min(self.open_seconds * 2, FWGS_BREAKER_OPEN_MAX)
+                self._open()
+                return
+            self.probe_successes += 1
+            if self.probe_successes >= FWGS_BREAKER_PROBES:
+                self.state = "closed"
+                self.outcomes.clear()
+                self.open_seconds = FWGS_BREAKER_OPEN_SECONDS
+                log(f"🟢 FWGS {self.name} circuit closed, API recovered")
+            return
+        
+        if outcome == "cancelled" or self.state != "closed":
+            return  # Late answers from before the breaker opened don't count
+        failed = outcome != "ok"
+        self.outcomes.append(failed)
+        if failed and len(self.outcomes) >= FWGS_BREAKER_MIN_CALLS:
+            failure_rate = sum(self.outcomes) / len(self.outcomes)
+            if failure_rate >= FWGS_BREAKER_FAIL_RATE:
+                self._open()
+    
+    def _open(self):
+        self.state = "open"
+        self.opened_until = asyncio.get_running_loop().time() + self.open_seconds
+        self.trips += 1
+        log(f"🔴 FWGS {self.name} circuit open for {self.open_seconds:.0f}s")
+    
+    def stats(self):
+        return f"{self.name}={self.state} (trips={self.trips}, rejected={self.rejected})"
+
+
+# Endpoint -> breaker family (the products endpoints all fail together)
+FWGS_BREAKER_FAMILY = {
+    "product": "product",
+    "fields": "product",
+    "bulk": "product",
+    "stock": "stock",
+    "location": "location",
+}
+fwgs_breakers = {family: CircuitBreaker(family) for family in set(FWGS_BREAKER_FAMILY.values())}
+
+def get_breaker(endpoint):
+    return fwgs_breakers[FWGS_BREAKER_FAMILY.get(endpoint, "product")]
+
+def breaker_stats():
+    return ", ".join(fwgs_breakers[family].stats() for family in sorted(fwgs_breakers))
+
+# ------------------------------------------------------------
+# HTTP cache: ETag / Last-Modified validators + plain TTL for slow-changing endpoints
+# ------------------------------------------------------------
+fwgs_stats = {"requests": 0, "coalesced": 0, "not_modified": 0, "ttl_hits": 0}
+http_cache = OrderedDict()  # {normalized url: {"etag", "last_modified", "data", "stored_at"}} - LRU order
+HTTP_CACHE_MAX_ENTRIES = 5000
+
+# Endpoints that rarely change are served from cache without a request for this long (seconds)
+FWGS_CACHE_TTL = {
+    "location": 24 * 60 * 60,  # Store addresses
+}
+
+# Endpoints never cached or revalidated - store quantities must always come from a fresh response
+FWGS_UNCACHED_ENDPOINTS = ("stock",)
+
+def _cache_get(key):
+    entry = http_cache.get(key)
+    if entry is not None:
+        http_cache.move_to_end(key)
+    return entry
+
+def _cache_put(key, resp, data):
+    http_cache[key] = {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "data": data,
+        "stored_at": asyncio.get_running_loop().time(),
+    }
+    http_cache.move_to_end(key)
+    while len(http_cache) > HTTP_CACHE_MAX_ENTRIES:
+        http_cache.popitem(last=False)
+
+async def _fwgs_request(url, endpoint, key):
+    """
+    Do one GET through the shared client and the global rate limiter.
+    Sends If-None-Match / If-Modified-Since when we have validators and turns a 304
+    into the cached parsed object; TTL endpoints are answered from cache while fresh.
+    FWGS_UNCACHED_ENDPOINTS (stock) bypass the cache entirely.
+    """
+    cacheable = endpoint not in FWGS_UNCACHED_ENDPOINTS
+    cached = _cache_get(key) if cacheable else None
+    ttl = FWGS_CACHE_TTL.get(endpoint)
+    if cached and ttl and asyncio.get_running_loop().time() - cached["stored_at"] < ttl:
+        fwgs_stats["ttl_hits"] += 1
+        return 200, cached["data"]
+    
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+    
+    breaker = get_breaker(endpoint)
+    breaker.before_request()  # Fail fast while the API is down
+    session = get_http_session()
+    try:
+        await fwgs_limiter.acquire()
+    except BaseException:
+        breaker.after_request("cancelled")
+        raise
+    started = asyncio.get_running_loop().time()
+    outcome = "error"
+    try:
+        async with session.get(url, headers=headers, timeout=FWGS_TIMEOUTS.get(endpoint)) as resp:
+            outcome = classify_fwgs_status(resp.status)
+            if resp.status == 304 and cached:
+                fwgs_stats["not_modified"] += 1
+                cached["stored_at"] = asyncio.get_running_loop().time()
+                return 200, cached["data"]
+            if resp.status != 200:
+                return resp.status, None
+            data = await resp.json(content_type=None)
+            if cacheable and (ttl or resp.headers.get("ETag") or resp.headers.get("Last-Modified")):
+                _cache_put(key, resp, data)
+            return resp.status, data
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        fwgs_limiter.release(outcome, asyncio.get_running_loop().time() - started)
+        breaker.after_request(outcome)
+
+# ------------------------------------------------------------
+# Single-flight: identical in-flight requests share one response
+# ------------------------------------------------------------
+inflight_requests = {}  # {normalized url: asyncio.Task}
+
+# Query params whose comma-separated values are order-insensitive
+UNORDERED_PARAMS = ("products", "locationIds", "fields", "productIds")
+
+def normalize_fwgs_url(url):
+    """
+    Canonical key for a FWGS request, so the same product (or the same
+    stockStatus product+locations) maps to one key regardless of param/ID order.
+    """
+    parts = urlsplit(url)
+    params = []
+    for key, value in parse_qsl(parts.query, keep_blank_values=True):
+        if key in UNORDERED_PARAMS:
+            value = ",".join(sorted(set(v.strip() for v in value.split(",") if v.strip())))
+        params.append((key, value))
+    params.sort()
+    return f"{parts.netloc}{parts.path.rstrip('/')}?{urlencode(params, safe=':,')}"
+
+def _forget_inflight(key, task):
+    if inflight_requests.get(key) is task:
+        del inflight_requests[key]
+    # Mark the exception as retrieved even if every waiter was cancelled
+    if not task.cancelled():
+        task.exception()
+
+async def fwgs_get_json(url, endpoint="product"):
+    """
+    GET a FWGS API url through the shared client and the global rate limiter.
+    Concurrent callers for the same normalized request await one shared response.
+    Returns: (status, data) - data is the decoded JSON on 200, otherwise None (don't mutate it, it's shared).
+    Timeouts and connection errors are raised to the caller (asyncio.TimeoutError / aiohttp.ClientError),
+    FWGSUnavailable while the endpoint's circuit breaker is open.
+    """
+    key = normalize_fwgs_url(url)
+    task = inflight_requests.get(key)
+    if task is None:
+        fwgs_stats["requests"] += 1
+        task = asyncio.create_task(_fwgs_request(url, endpoint, key))
+        inflight_requests[key] = task
+        task.add_done_callback(lambda t: _forget_inflight(key, t))
+    else:
+        fwgs_stats["coalesced"] += 1
+    # shield: one caller giving up must not cancel the request for the others
+    return await asyncio.shield(task)
+
+# ============================================================
+# SLIDING-WINDOW FETCHER
+# ============================================================
+FETCH_WINDOW = FWGS_CONCURRENCY_MAX  # Max fetch tasks alive at once (fwgs_limiter still decides what's on the wire)
+
+async def fetch_stream(items, fetch_func, max_in_flight=FETCH_WINDOW):
+    """
+    Bounded-concurrency streaming fetcher.
+    Keeps up to max_in_flight fetch_func(item) calls running and starts the next one
+    as soon as any slot frees up - no waiting on the slowest request of a batch.
+    Yields: (item, result, latency_seconds) in completion order.
+            result is the raised exception if fetch_func failed.
+            latency is end-to-end for the item (includes waiting on fwgs_limiter).
+    """
+    loop = asyncio.get_running_loop()
+    items_iter = iter(items)
+    pending = set()
+    
+    async def timed(item):
+        started = loop.time()
+        try:
+            result = await fetch_func(item)
+        except Exception as e:
+            result = e
+        return item, result, loop.time() - started
+    
+    exhausted = object()
+    
+    def fill():
+        while len(pending) < max_in_flight:
+            item = next(items_iter, exhausted)
+            if item is exhausted:
+                return
+            pending.add(asyncio.create_task(timed(item)))
+    
+    try:
+        fill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            fill()  # Refill before handing results back so the window stays full
+            for task in done:
+                yield task.result()
+    finally:
+        # Consumer stopped early (or was cancelled) - don't leak requests
+        for task in pending:
+            task.cancel()
+
+def pacing_offset(key, window):
+    """
+    Deterministic offset in [0, window) for a work item (product/user ID).
+    Spreads items evenly over an interval and keeps each one on the same slot every cycle.
+    """
+    return zlib.crc32(str(key).encode()) / 2 ** 32 * window
+
+def latency_summary(latencies):
+    """Format p50/p95/max of a list of latencies (seconds) for logs."""
+    if not latencies:
+        return "no data"
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2]
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"p50={p50 * 1000:.0f}ms p95={p95 * 1000:.0f}ms max={ordered[-1] * 1000:.0f}ms"
+
 # ============================================================
 # API FUNCTIONS
 # ============================================================
 
 BASE_URL = "https://www.finewineandgoodspirits.com"
 
-def get_product_info(pid):
-    """Fetch product details from the FWGS API."""
-    headers = {"User-Agent": "Mozilla/5.0"}
-    product_url = f"{BASE_URL}/ccstore/v1/products/{pid}"
+def parse_product_data(data, pid):
+    """Turn a ccstore product document into our product info dict (without stock)."""
+    parent_categories = data.get("parentCategories", [])
+    parent_category = ", ".join(
+        cat.get("displayName", cat.get("repositoryId", "N/A"))
+        for cat in parent_categories
+    ) if parent_categories else "N/A"
+    
+    active = data.get("active", "N/A")
+    display_name = data.get("displayName", "Unknown")
+    highly_allocated = data.get("b2c_highlyAllocatedProduct", "N/A")
+    lottery_product = data.get("b2c_lotteryProduct", "N/A")
+    repo_id = data.get("repositoryId", pid)
+    order_limit = data.get("b2c_limitPerOrder", "N/A")
+    route = data.get("route", "")
+    product_full_url = f"{BASE_URL}{route}" if route else f"{BASE_URL}/product/{pid}"
+    
+    thumb_path = data.get("primarySmallImageURL")
+    thumbnail_url = f"{BASE_URL}{thumb_path}" if thumb_path else None
+    
+    list_price = data.get("listPrice", "N/A")
+    if isinstance(list_price, dict):
+        list_price = list_price.get("value", "N/A")
+    
+    return {
+        "ProductID": str(repo_id),
+        "Name": display_name,
+        "Category": parent_category,
+        "Active": str(active),
+        "InStock": 0,
+        "Allocated": highly_allocated,
+        "Lottery": lottery_product,
+        "Price": str(list_price),
+        "OdrLmt": order_limit,
+        "Thumbnail": thumbnail_url,
+        "product_full_url": product_full_url
+    }
+
+def parse_stock_quantity(stock_data):
+    """Get the e-commerce quantity from a stockStatus response (0 if missing/invalid)."""
+    stock_info = stock_data.get("items", [])[0] if stock_data.get("items") else {}
+    quantity = stock_info.get("inStockQuantity", 0)
+    if not str(quantity).isdigit():
+        quantity = 0
+    return int(quantity)
+
+async def get_product_stock(pid):
+    """Fetch the e-commerce stock quantity for a product (0 on any error)."""
     stock_url = (
         f"{BASE_URL}/ccstore/v1/stockStatus"
         f"?actualStockStatus=true&expandStockDetails=true&products=repositoryId%3A{pid}&locationIds=9650"
     )
+    try:
+        status_code, stock_data = await fwgs_get_json(stock_url, endpoint="stock")
+        if status_code == 200:
+            return parse_stock_quantity(stock_data)
+        return 0
+    except Exception:
+        return 0
+
+async def get_product_info(pid):
+    """Fetch product details + e-commerce stock from the FWGS API (non-blocking)."""
+    product_url = f"{PRODUCT_BASE_URL}/{pid}"
     
     try:
-        res = requests.get(product_url, headers=headers, timeout=10)
-        if res.status_code >= 400:
-            log(f"❌ Invalid product ID {pid} (HTTP {res.status_code})")
+        # Product document and stock are independent - fetch them together
+        (status_code, data), quantity = await asyncio.gather(
+            fwgs_get_json(product_url, endpoint="product"),
+            get_product_stock(pid)
+        )
+        if status_code != 200:
+            log(f"❌ Invalid product ID {pid} (HTTP {status_code})")
             return None
         
-        data = res.json()
-        
-        parent_categories = data.get("parentCategories", [])
-        parent_category = ", ".join(
-            cat.get("displayName", cat.get("repositoryId", "N/A"))
-            for cat in parent_categories
-        ) if parent_categories else "N/A"
-        
-        active = data.get("active", "N/A")
-        display_name = data.get("displayName", "Unknown")
-        highly_allocated = data.get("b2c_highlyAllocatedProduct", "N/A")
-        lottery_product = data.get("b2c_lotteryProduct", "N/A")
-        repo_id = data.get("repositoryId", pid)
-        order_limit = data.get("b2c_limitPerOrder", "N/A")
-        route = data.get("route", "")
-        product_full_url = f"{BASE_URL}{route}" if route else f"{BASE_URL}/product/{pid}"
-        
-        thumb_path = data.get("primarySmallImageURL")
-        thumbnail_url = f"{BASE_URL}{thumb_path}" if thumb_path else None
-        
-        list_price = data.get("listPrice", "N/A")
-        if isinstance(list_price, dict):
-            list_price = list_price.get("value", "N/A")
-        
-        # Fetch stock
-        try:
-            stock_res = requests.get(stock_url, headers=headers, timeout=10)
-            if stock_res.status_code < 400:
-                stock_data = stock_res.json()
-                stock_info = stock_data.get("items", [])[0] if stock_data.get("items") else {}
-                quantity = stock_info.get("inStockQuantity", 0)
-                if not str(quantity).isdigit():
-                    quantity = 0
-            else:
-                quantity = 0
-        except Exception:
-            quantity = 0
-        
-        return {
-            "ProductID": str(repo_id),
-            "Name": display_name,
-            "Category": parent_category,
-            "Active": str(active),
-            "InStock": int(quantity),
-            "Allocated": highly_allocated,
-            "Lottery": lottery_product,
-            "Price": str(list_price),
-            "OdrLmt": order_limit,
-            "Thumbnail": thumbnail_url,
-            "product_full_url": product_full_url
-        }
+        info = parse_product_data(data, pid)
+        info["InStock"] = quantity
+        return info
+    except FWGSUnavailable:
+        return None  # Circuit open - already logged once by the breaker
     except Exception as e:
         log(f"❌ Error fetching product {pid}: {e}")
         return None
 
+async def get_product_info_batch(product_ids):
+    """Fetch product info for many IDs concurrently.
+    Returns: dict of {pid: info or None}
+    """
+    unique_ids = list(dict.fromkeys(product_ids))
+    results = await asyncio.gather(*(get_product_info(pid) for pid in unique_ids))
+    return dict(zip(unique_ids, results))
+
 # ============================================================
 # DATABASE OPERATIONS - WATCHLIST
 # ============================================================
@@ -655,7 +1278,8 @@ def add_to_global_products(product_info):
             order_limit = EXCLUDED.order_limit,
             product_full_url = EXCLUDED.product_full_url,
             thumbnail_url = EXCLUDED.thumbnail_url,
-            last_updated = CURRENT_TIMESTAMP;
+            last_updated = CURRENT_TIMESTAMP
+        RETURNING (xmax = 0) AS inserted;
     """
     
     active_bool = product_info.get("Active", "false").lower() in ("true", "yes", "1")
@@ -679,8 +1303,13 @@ def add_to_global_products(product_info):
         conn = get_db()
         cur = conn.cursor()
         cur.execute(query, params)
+        inserted = cur.fetchone()[0]
+        if inserted:
+            # New product - wake the workers' catalog resync (delivered on commit)
+            cur.execute("SELECT pg_notify(%s, %s);", (CATALOG_CHANNEL, str(product_info["ProductID"])))
         conn.commit()
         cur.close()
+        monitor_state_upsert_product(product_info)
         return True
     except Exception as e:
         if conn:
@@ -797,13 +1426,16 @@ async def add_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
     already_in = []
     invalid = []
     
-    for raw_pid in raw_ids:
-        pid = normalize_pid(raw_pid)
+    # Validate all IDs at once (concurrent, doesn't block other users)
+    normalized = [(raw_pid, normalize_pid(raw_pid)) for raw_pid in raw_ids]
+    infos = await get_product_info_batch([pid for _, pid in normalized if pid is not None])
+    
+    for raw_pid, pid in normalized:
         if pid is None:
             invalid.append(raw_pid)
             continue
         
-        info = get_product_info(pid)
+        info = infos.get(pid)
         if not info:
             invalid.append(raw_pid)
             continue
@@ -905,6 +1537,13 @@ async def kill_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await context.application.updater.stop()
         await context.application.stop()
         await context.application.shutdown()
+        await stop_supervised_jobs()  # Cancel in-flight monitor/inventory runs
+        await close_http_session()  # Close FWGS HTTP client
+        flush_state_writes(force=True)  # Persist buffered monitor states
+        release_leadership()  # Let a standby take over right away
+        if SHARDED_MONITOR:
+            deregister_shard_worker()
+        stop_notification_listener()
         close_pool()  # Close database connections
         log("✅ Clean shutdown complete")
     except Exception as e:
@@ -977,26 +1616,19 @@ async def addstore_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"Store {store} is already in your tracked stores.")
         return
     
-    headers = {"User-Agent": "Mozilla/5.0", "Accept": "application/json"}
-    
-    import aiohttp
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(
-                FWGS_LOCATION_URL.format(store=store),
-                timeout=aiohttp.ClientTimeout(total=10),
-                headers=headers
-            ) as resp:
-                if resp.status != 200:
-                    await update.message.reply_text(
-                        f"Failed to fetch store info for {store}. Status {resp.status}"
-                    )
-                    return
-                data = await resp.json()
-        except Exception as e:
-            await update.message.reply_text(f"Error fetching store info for {store}: {e}")
+    try:
+        status_code, data = await fwgs_get_json(
+            FWGS_LOCATION_URL.format(store=store), endpoint="location"
+        )
+        if status_code != 200:
+            await update.message.reply_text(
+                f"Failed to fetch store info for {store}. Status {status_code}"
+            )
             return
-    
+    except Exception as e:
+        await update.message.reply_text(f"Error fetching store info for {store}: {e}")
+        return
+
     city = data.get("city", "Unknown")
     address = data.get("address1", "Unknown")
     
@@ -1079,8 +1711,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    import aiohttp
-    
     text = update.message.text.strip()
     
     if not text.isdigit():
@@ -1090,7 +1720,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pid = text
     await update.message.reply_text(f"🔎 Fetching info for {pid}...")
     
-    info = get_product_info(pid)
+    info = await get_product_info(pid)
     if not info:
         await update.message.reply_text("⚠️ Could not retrieve product info.")
         return
@@ -1109,28 +1739,21 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_stores = get_user_stores(user_id)
     
     if user_stores:
-        headers = {"User-Agent": "Mozilla/5.0"}
         location_ids_str = ",".join([store_id for store_id, _, _ in user_stores])
         url = FWGS_STOCKSTATUS_URL.format(pid=pid, store=location_ids_str)
-        
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(
-                    url, 
-                    timeout=aiohttp.ClientTimeout(total=10), 
-                    headers=headers
-                ) as resp:
-                    if resp.status == 200:
-                        data = await resp.json(content_type=None)
-                        qty_map = {
-                            str(item["locationId"]): item.get("inStockQuantity", 0)
-                            for item in data.get("items", [])
-                        }
-                    else:
-                        qty_map = {}
-            except Exception as e:
-                log(f"Error fetching store stock: {e}")
+
+        try:
+            status_code, data = await fwgs_get_json(url, endpoint="stock")
+            if status_code == 200:
+                qty_map = {
+                    str(item["locationId"]): item.get("inStockQuantity", 0)
+                    for item in data.get("items", [])
+                }
+            else:
                 qty_map = {}
+        except Exception as e:
+            log(f"Error fetching store stock: {e}")
+            qty_map = {}
         
         store_lines = []
         for store_id, city, address in user_stores:
@@ -1177,6 +1800,10 @@ async def refresh_global_list(app=None, send_report_to_owner=True):
         if not product_ids:
             log("⚠️ No products in global_products; skipping report.")
             return
+        
+        if fwgs_breakers["product"].is_open():
+            log("⚠️ FWGS products API circuit is open; skipping report.")
+            return
     except Exception as e:
         log(f"❌ Error at start of refresh_global_list: {e}")
         log(f"Traceback: {traceback.format_exc()}")
@@ -1186,118 +1813,33 @@ async def refresh_global_list(app=None, send_report_to_owner=True):
     all_data = []
     log(f"Starting concurrent fetch for {len(product_ids)} products...")
     
-    # Use asyncio to fetch multiple products at once
-    import aiohttp
-    
-    async def fetch_product_async(pid, session):
-        """Async wrapper for get_product_info"""
-        headers = {"User-Agent": "Mozilla/5.0"}
-        product_url = f"{PRODUCT_BASE_URL}/{pid}"
-        stock_url = (
-            f"{BASE_URL}/ccstore/v1/stockStatus"
-            f"?actualStockStatus=true&expandStockDetails=true&products=repositoryId%3A{pid}&locationIds=9650"
-        )
-        
-        try:
-            # Fetch product data
-            async with session.get(product_url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as res:
-                if res.status >= 400:
-                    log(f"❌ Invalid product ID {pid} (HTTP {res.status})")
-                    return None
-                
-                data = await res.json()
-                
-                parent_categories = data.get("parentCategories", [])
-                parent_category = ", ".join(
-                    cat.get("displayName", cat.get("repositoryId", "N/A"))
-                    for cat in parent_categories
-                ) if parent_categories else "N/A"
-                
-                active = data.get("active", "N/A")
-                display_name = data.get("displayName", "Unknown")
-                highly_allocated = data.get("b2c_highlyAllocatedProduct", "N/A")
-                lottery_product = data.get("b2c_lotteryProduct", "N/A")
-                repo_id = data.get("repositoryId", pid)
-                order_limit = data.get("b2c_limitPerOrder", "N/A")
-                route = data.get("route", "")
-                product_full_url = f"{BASE_URL}{route}" if route else f"{BASE_URL}/product/{pid}"
-                
-                thumb_path = data.get("primarySmallImageURL")
-                thumbnail_url = f"{BASE_URL}{thumb_path}" if thumb_path else None
-                
-                list_price = data.get("listPrice", "N/A")
-                if isinstance(list_price, dict):
-                    list_price = list_price.get("value", "N/A")
-                
-                # Fetch stock
-                try:
-                    async with session.get(stock_url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as stock_res:
-                        if stock_res.status < 400:
-                            stock_data = await stock_res.json()
-                            stock_info = stock_data.get("items", [])[0] if stock_data.get("items") else {}
-                            quantity = stock_info.get("inStockQuantity", 0)
-                            if not str(quantity).isdigit():
-                                quantity = 0
-                        else:
-                            quantity = 0
-                except Exception:
-                    quantity = 0
-                
-                return {
-                    "ProductID": str(repo_id),
-                    "Name": display_name,
-                    "Category": parent_category,
-                    "Active": str(active),
-                    "InStock": int(quantity),
-                    "Allocated": highly_allocated,
-                    "Lottery": lottery_product,
-                    "Price": str(list_price),
-                    "OdrLmt": order_limit,
-                    "Thumbnail": thumbnail_url,
-                    "product_full_url": product_full_url
-                }
-        except Exception as e:
-            log(f"❌ Error fetching product {pid}: {e}")
-            return None
-    
-    # Fetch all products concurrently in batches
-    BATCH_SIZE = 20
-    async with aiohttp.ClientSession() as session:
-        for i in range(0, len(product_ids), BATCH_SIZE):
-            batch = product_ids[i:i+BATCH_SIZE]
-            log(f"Fetching batch {i//BATCH_SIZE + 1}/{(len(product_ids)-1)//BATCH_SIZE + 1} ({len(batch)} products)...")
-            
-            # Fetch all in batch concurrently
-            tasks = [fetch_product_async(pid, session) for pid in batch]
-            results = await asyncio.gather(*tasks)
-            
-            # Process results
-            for j, product_info in enumerate(results):
-                if product_info:
-                    log(f"[{i+j+1}/{len(product_ids)}] Fetched: {batch[j]} | {product_info.get('Name')}")
-                    all_data.append(product_info)
-                    # Update database with fresh data
-                    add_to_global_products(product_info)
-                else:
-                    # Use placeholder for failed fetches
-                    pid = batch[j]
-                    product_info = {
-                        "ProductID": str(pid),
-                        "Name": "Unknown",
-                        "Category": "N/A",
-                        "Active": "N/A",
-                        "InStock": 0,
-                        "Price": 0,
-                        "Allocated": "N/A",
-                        "Lottery": "N/A",
-                        "OdrLmt": "N/A"
-                    }
-                    all_data.append(product_info)
-            
-            # Small delay between batches
-            if i + BATCH_SIZE < len(product_ids):
-                await asyncio.sleep(0.5)
-    
+    # Fetch all products through the sliding-window fetcher
+    latencies = []
+    fetched = 0
+    async for pid, product_info, latency in fetch_stream(product_ids, get_product_info):
+        fetched += 1
+        latencies.append(latency)
+        if product_info and not isinstance(product_info, Exception):
+            log(f"[{fetched}/{len(product_ids)}] Fetched: {pid} | {product_info.get('Name')}")
+            all_data.append(product_info)
+            # Update database with fresh data
+            add_to_global_products(product_info)
+        else:
+            # Use placeholder for failed fetches
+            product_info = {
+                "ProductID": str(pid),
+                "Name": "Unknown",
+                "Category": "N/A",
+                "Active": "N/A",
+                "InStock": 0,
+                "Price": 0,
+                "Allocated": "N/A",
+                "Lottery": "N/A",
+                "OdrLmt": "N/A"
+            }
+            all_data.append(product_info)
+    
+    log(f"⏱️ Report fetch time per product: {latency_summary(latencies)}")
     log(f"✅ Fetched data for {len(all_data)} products")
     
     if not all_data:
@@ -1521,6 +2063,7 @@ async def refresh_global_list(app=None, send_report_to_owner=True):
     # Save final workbook
     wb.save(filename)
     log(f"\n✅ Excel file saved, formatted: {filename}")
+    save_global_report(filename)
 
     # Send the report to all users
     if app:
@@ -1625,6 +2168,73 @@ def get_all_users():
         if conn:
             return_db(conn)
             
+GLOBAL_REPORT_KEEP_DAYS = 7
+
+def save_global_report(filename):
+    """
+    Store the finished report in Postgres - the bot role runs on another dyno and
+    can't see the worker's /data. Keeps the last GLOBAL_REPORT_KEEP_DAYS days.
+    Returns: True on success
+    """
+    query = """
+        INSERT INTO global_reports (report_date, filename, content, created_at)
+        VALUES (CURRENT_DATE, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (report_date) DO UPDATE SET
+            filename = EXCLUDED.filename,
+            content = EXCLUDED.content,
+            created_at = CURRENT_TIMESTAMP;
+    """
+    conn = None
+    try:
+        with open(filename, "rb") as f:
+            content = f.read()
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(query, (os.path.basename(filename), psycopg2.Binary(content)))
+        cur.execute(
+            "DELETE FROM global_reports WHERE report_date < CURRENT_DATE - %s;",
+            (GLOBAL_REPORT_KEEP_DAYS,)
+        )
+        conn.commit()
+        cur.close()
+        log(f"✅ Stored report {os.path.basename(filename)} in database ({len(content)} bytes)")
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        log(f"❌ Error storing report: {e}")
+        return False
+    finally:
+        if conn:
+            return_db(conn)
+
+def get_latest_global_report():
+    """
+    Get today's or yesterday's report from Postgres.
+    Returns: (filename, content bytes) or None
+    """
+    query = """
+        SELECT filename, content 
+        FROM global_reports 
+        WHERE report_date >= CURRENT_DATE - 1
+        ORDER BY report_date DESC 
+        LIMIT 1;
+    """
+    conn = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(query)
+        result = cur.fetchone()
+        cur.close()
+        return (result[0], bytes(result[1])) if result else None
+    except Exception as e:
+        log(f"❌ Error getting latest report: {e}")
+        return None
+    finally:
+        if conn:
+            return_db(conn)
+
 async def send_global_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler for /lastreport command - REQUIRES SUBSCRIPTION."""
     user_id = str(update.effective_user.id)
@@ -1637,25 +2247,18 @@ async def send_global_report(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return
     
-    DATA_DIR = "/data"
-    today_str = datetime.now().strftime("%Y%m%d")
-    filename = os.path.join(DATA_DIR, f"{REPORT_PREFIX}{today_str}.xlsx")
-    
-    if not os.path.exists(filename):
-        yesterday_str = (datetime.now() - timedelta(days=1)).strftime("%Y%m%d")
-        filename = f"{REPORT_PREFIX}{yesterday_str}.xlsx"
-    
-    if not os.path.exists(filename):
+    report = get_latest_global_report()
+    if not report:
         await update.message.reply_text("⚠️ No recent report found. The next report will be generated at 9 AM.")
         return
     
+    filename, content = report
     try:
-        with open(filename, 'rb') as f:
-            await update.message.reply_document(
-                document=f,
-                caption="🥃 Here's the most recent FWGS product report!",
-                filename=os.path.basename(filename)
-            )
+        await update.message.reply_document(
+            document=content,
+            caption="🥃 Here's the most recent FWGS product report!",
+            filename=filename
+        )
         log(f"✅ Sent report to user {update.effective_user.id}")
     except Exception as e:
         log(f"❌ Error sending report: {e}")
@@ -1665,101 +2268,380 @@ async def send_global_report(update: Update, context: ContextTypes.DEFAULT_TYPE)
 # MONITORING HELPER FUNCTIONS - ACTIVE and CATEGORY
 # ============================================================
 
-async def get_active_only(pid, session):
+def parse_active(data):
+    """Get the active flag from a product document (None if missing)."""
+    active = data.get("active")
+    return None if active is None else bool(active)
+
+def parse_category_ids(data):
     """
-    Lightweight: fetch ONLY the active flag for a product.
-    Returns: (pid, True/False) or (pid, None) on error.
+    Get the parentCategories repositoryIds from a product document (None if missing).
+    Response: {"parentCategories": [{"repositoryId": "whiskey-release"}, {"repositoryId": "157"}]}
     """
-    headers = {"User-Agent": "Mozilla/5.0"}
-    url = f"{PRODUCT_BASE_URL}/{pid}?fields=active"
+    parent_categories = data.get("parentCategories")
     
-    try:
-        # Reduced timeout - fail faster
-        timeout = aiohttp.ClientTimeout(
-            total=3,      # Reduced from 5s
-            connect=2,    # Max 2s to connect
-            sock_read=2   # Max 2s to read
-        )
-        
-        async with session.get(url, headers=headers, timeout=timeout) as resp:
-            if resp.status != 200:
-                # Log specific status codes to help debug
-                if resp.status != 404:  # Don't spam logs with expected 404s
-                    log(f"⚠️ Status {resp.status} for {pid}")
-                return (pid, None)
-            
-            data = await resp.json()
-            active = data.get("active")
-            
-            if active is None:
-                log(f"⚠️ No 'active' field in response for {pid}")
-                return (pid, None)
-            
-            return (pid, bool(active))
-            
-    except asyncio.TimeoutError:
-        # Don't log every timeout, it's too noisy
-        return (pid, None)
-    except aiohttp.ClientError as e:
-        # Only log unexpected errors
-        log(f"⚠️ Client error for {pid}: {type(e).__name__}")
-        return (pid, None)
-    except Exception as e:
-        log(f"⚠️ Error fetching active for {pid}: {e}")
-        return (pid, None)
-
+    if not parent_categories or not isinstance(parent_categories, list):
+        return None
+    
+    category_ids = []
+    for cat in parent_categories:
+        if isinstance(cat, dict) and "repositoryId" in cat:
+            category_ids.append(str(cat["repositoryId"]))
+    
+    return category_ids or None
 
-async def get_category_only(pid, session):
+def parse_flag_text(value):
+    """Text form of a scalar FWGS field as it's stored in product_cache (None if missing)."""
+    if value is None:
+        return None
+    if isinstance(value, dict):  # e.g. listPrice {"value": 29.99}
+        value = value.get("value")
+    return None if value is None else str(value)
+
+# ------------------------------------------------------------
+# Change detectors: each one reads its fields from the same swept document
+# ------------------------------------------------------------
+class Detector:
     """
-    Lightweight: fetch ONLY the parentCategories for a product.
-    Returns: (pid, [category_ids]) or (pid, None) on error.
+    One monitored signal. The sweep fetches the union of every detector's fields once per
+    product; each detector parses its value, decides whether it changed and words the alert.
+    Subclasses set name (state/change_type key), fields (ccstore fields) and column (product_cache).
     """
-    headers = {"User-Agent": "Mozilla/5.0"}
-    url = f"{PRODUCT_BASE_URL}/{pid}?fields=parentCategories"
+    name = None
+    fields = ()
+    column = None
+    label = None         # send_monitor_alerts label
+    info_key = None      # global_products info key kept in sync in monitor_state (used for tiering)
     
-    try:
-        timeout = aiohttp.ClientTimeout(
-            total=3,
-            connect=1,
-            sock_read=2
-        )
-        
-        async with session.get(url, headers=headers, timeout=timeout) as resp:
-            if resp.status != 200:
-                if resp.status != 404:
-                    log(f"⚠️ Category status {resp.status} for {pid}")
-                return (pid, None)
-            
-            data = await resp.json()
-            
-            # Extract parentCategories from response
-            parent_categories = data.get("parentCategories")
-            
-            if not parent_categories or not isinstance(parent_categories, list):
-                return (pid, None)
-            
-            # Extract repositoryId from each category object
-            # Response: {"parentCategories": [{"repositoryId": "whiskey-release"}, {"repositoryId": "157"}]}
-            category_ids = []
-            for cat in parent_categories:
-                if isinstance(cat, dict) and "repositoryId" in cat:
-                    category_ids.append(str(cat["repositoryId"]))
-            
-            if not category_ids:
-                return (pid, None)
-            
-            return (pid, category_ids)
-            
-    except asyncio.TimeoutError:
-        return (pid, None)
-    except aiohttp.ClientError:
-        return (pid, None)
-    except Exception as e:
-        log(f"⚠️ Error fetching category for {pid}: {e}")
-        return (pid, None)
-
-def get_product_active_state(product_id):
-    """Get the last known active state from product_cache."""
+    def parse(self, data):
+        return parse_flag_text(data.get(self.fields[0]))
+    
+    def changed(self, prev, now):
+        return prev != now
+    
+    def alert(self, info, prev, now):
+        """Alert text for users watching the product, or None. prev is None the first time."""
+        return None
+    
+    def persist(self, updates):
+        """Write {pid: value} to product_cache. Returns: True on success"""
+        return set_product_cache_column_batch(self.column, updates)
+
+
+class ActiveDetector(Detector):
+    name = "active"
+    fields = ("active",)
+    column = "last_qty"
+    label = "active"
+    
+    def parse(self, data):
+        return parse_active(data)
+    
+    def alert(self, info, prev, now):
+        if prev is None:
+            return None  # First time seeing this product
+        name = info.get("Name", "Unknown")
+        log(f"🔔 Status change: {name} is now {'ACTIVE' if now else 'INACTIVE'}")
+        if now:
+            return f"🔥 <a href='{info.get('product_full_url', '')}'>{name}</a> is ACTIVE!"
+        return f"⚠️ {name} is INACTIVE."
+    
+    def persist(self, updates):
+        return set_product_active_states_batch(updates)
+
+
+class CategoryDetector(Detector):
+    name = "categories"
+    fields = ("parentCategories",)
+    column = "category"
+    label = "whiskey-release"
+    
+    def parse(self, data):
+        category_ids = parse_category_ids(data)
+        return None if category_ids is None else [c.lower() for c in category_ids]
+    
+    def changed(self, prev, now):
+        return sorted(prev or []) != sorted(now)
+    
+    def alert(self, info, prev, now):
+        # Fires for products first seen already in whiskey-release too
+        if "whiskey-release" not in now or "whiskey-release" in (prev or []):
+            return None
+        name = info.get("Name", "Unknown")
+        url = info.get("product_full_url", "")
+        log(f"🔔 NEW whiskey-release: {name}")
+        if url:
+            return f"📣 <a href='{url}'>{name}</a> added to Whiskey-Release!"
+        return f"📣 Whiskey-release added for {name}!"
+    
+    def persist(self, updates):
+        return set_product_categories_batch(updates)
+
+
+class PriceDetector(Detector):
+    name = "price"
+    fields = ("listPrice",)
+    column = "price"
+    label = "price"
+    
+    def alert(self, info, prev, now):
+        if prev is None:
+            return None
+        name = info.get("Name", "Unknown")
+        return f"💲 <a href='{info.get('product_full_url', '')}'>{name}</a> price changed: ${prev} ➜ ${now}"
+
+
+class OrderLimitDetector(Detector):
+    name = "limit_per_order"
+    fields = ("b2c_limitPerOrder",)
+    column = "limit_per_order"
+    label = "order limit"
+    
+    def alert(self, info, prev, now):
+        if prev is None:
+            return None
+        return f"🧮 {info.get('Name', 'Unknown')} order limit changed: {prev} ➜ {now}"
+
+
+class AllocatedDetector(Detector):
+    name = "highly_allocated"
+    fields = ("b2c_highlyAllocatedProduct",)
+    column = "highly_allocated"
+    label = "allocation"
+    info_key = "Allocated"
+    
+    def alert(self, info, prev, now):
+        if prev is None:
+            return None
+        if is_flag_set(now):
+            return f"🔒 {info.get('Name', 'Unknown')} is now Highly Allocated."
+        return f"🔓 {info.get('Name', 'Unknown')} is no longer Highly Allocated."
+
+
+class LotteryDetector(Detector):
+    name = "lottery"
+    fields = ("b2c_lotteryProduct",)
+    column = "lottery"
+    label = "lottery"
+    info_key = "Lottery"
+    
+    def alert(self, info, prev, now):
+        if prev is None:
+            return None
+        if is_flag_set(now):
+            return f"🎟️ {info.get('Name', 'Unknown')} is now a Lottery product."
+        return f"🎟️ {info.get('Name', 'Unknown')} is no longer a Lottery product."
+
+
+# Every detector runs over the same sweep - adding one adds no HTTP requests
+MONITOR_DETECTORS = [
+    ActiveDetector(),
+    CategoryDetector(),
+    PriceDetector(),
+    OrderLimitDetector(),
+    AllocatedDetector(),
+    LotteryDetector(),
+]
+DETECTORS_BY_NAME = {detector.name: detector for detector in MONITOR_DETECTORS}
+
+# One combined ?fields= request feeds every detector
+MONITOR_FIELDS = ",".join(dict.fromkeys(field for detector in MONITOR_DETECTORS for field in detector.fields))
+
+def parse_monitor_fields(data):
+    """Pull every monitored field out of a (trimmed) product document: {detector name: value or None}"""
+    return {detector.name: detector.parse(data) for detector in MONITOR_DETECTORS}
+
+def run_detectors(fetched, global_cache, prev_values):
+    """
+    Diff every detector over one sweep.
+    Args:
+        fetched: {pid: parse_monitor_fields(...)}
+        prev_values: {detector name: {pid: last known value}}
+    Returns: (updates {name: {pid: value}}, changes [(pid, name)], alerts {name: [(pid, msg)]})
+             updates include first-seen values; changes/alerts only real changes.
+    """
+    updates = {detector.name: {} for detector in MONITOR_DETECTORS}
+    changes = []
+    alerts = {detector.name: [] for detector in MONITOR_DETECTORS}
+    
+    for pid, fields in fetched.items():
+        info = global_cache.get(pid, {})
+        for detector in MONITOR_DETECTORS:
+            now = fields.get(detector.name)
+            if now is None:
+                continue  # Field missing from this response
+            prev = prev_values[detector.name].get(pid)
+            if prev is not None and not detector.changed(prev, now):
+                continue
+            updates[detector.name][pid] = now
+            if prev is not None:
+                changes.append((pid, detector.name))
+            msg = detector.alert(info, prev, now)
+            if msg:
+                alerts[detector.name].append((pid, msg))
+    
+    return updates, changes, alerts
+
+async def get_monitor_fields(pid):
+    """
+    Lightweight: fetch every detector's fields for a product in ONE request.
+    Returns: (pid, {"active": True/False/None, "categories": [category_ids] or None, ...})
+             or (pid, None) on error.
+    """
+    url = f"{PRODUCT_BASE_URL}/{pid}?fields={MONITOR_FIELDS}"
+    
+    try:
+        # Short "fields" timeout - fail faster
+        status_code, data = await fwgs_get_json(url, endpoint="fields")
+        if status_code != 200:
+            # Log specific status codes to help debug
+            if status_code != 404:  # Don't spam logs with expected 404s
+                log(f"⚠️ Status {status_code} for {pid}")
+            return (pid, None)
+        
+        fields = parse_monitor_fields(data)
+        
+        if fields["active"] is None:
+            log(f"⚠️ No 'active' field in response for {pid}")
+        
+        return (pid, fields)
+        
+    except (asyncio.TimeoutError, FWGSUnavailable):
+        # Don't log every timeout, it's too noisy
+        return (pid, None)
+    except aiohttp.ClientError as e:
+        # Only log unexpected errors
+        log(f"⚠️ Client error for {pid}: {type(e).__name__}")
+        return (pid, None)
+    except Exception as e:
+        log(f"⚠️ Error fetching monitor fields for {pid}: {e}")
+        return (pid, None)
+
+# Bulk mode: ask the products collection for many repository IDs per request
+BULK_PRODUCT_CHUNK = 50  # IDs per request (keeps the URL well under server limits)
+
+async def get_monitor_fields_chunk(chunk):
+    """
+    Fetch monitor fields for a chunk of products with ONE products-collection request.
+    Returns: (status, {pid: fields}) - status "ok", "unsupported" (4xx) or "failed" (429/5xx/timeout/error).
+    """
+    bulk_fields = ",".join(f"items.{f}" for f in ["repositoryId"] + MONITOR_FIELDS.split(","))
+    url = (
+        f"{PRODUCT_BASE_URL}?productIds={','.join(chunk)}"
+        f"&fields={bulk_fields}&limit={len(chunk)}"
+    )
+    
+    try:
+        status_code, data = await fwgs_get_json(url, endpoint="bulk")
+    except (asyncio.TimeoutError, aiohttp.ClientError, FWGSUnavailable):
+        return ("failed", {})
+    except Exception as e:
+        log(f"⚠️ Error fetching bulk monitor fields: {e}")
+        return ("failed", {})
+    
+    if status_code != 200:
+        if status_code == 429 or status_code >= 500:
+            return ("failed", {})
+        log(f"⚠️ Bulk products request returned {status_code}, falling back to per-product")
+        return ("unsupported", {})
+    
+    results = {}
+    for item in data.get("items", []) or []:
+        if isinstance(item, dict) and item.get("repositoryId") is not None:
+            results[str(item["repositoryId"])] = parse_monitor_fields(item)
+    return ("ok", results)
+
+async def fetch_monitor_fields(product_ids):
+    """
+    Fetch monitor fields for many products: bulk collection requests first, then
+    per-product requests only for IDs the bulk responses didn't include.
+    Returns: (results {pid: fields}, failed [pids], latencies [seconds], request_count)
+    """
+    results = {}
+    failed = []
+    latencies = []
+    request_count = 0
+    wanted = set(product_ids)
+    fallback = []
+    
+    chunks = [tuple(product_ids[i:i + BULK_PRODUCT_CHUNK]) for i in range(0, len(product_ids), BULK_PRODUCT_CHUNK)]
+    async for chunk, result, latency in fetch_stream(chunks, get_monitor_fields_chunk):
+        request_count += 1
+        latencies.append(latency)
+        if isinstance(result, Exception):
+            failed.extend(chunk)
+            continue
+        status, chunk_results = result
+        if status == "failed":
+            failed.extend(chunk)  # API is struggling - don't multiply load with per-product retries
+            continue
+        for pid, fields in chunk_results.items():
+            if pid in wanted:
+                results[pid] = fields
+        fallback.extend(pid for pid in chunk if pid not in chunk_results)
+    
+    # Per-product fallback for IDs that went missing from the bulk responses
+    async for pid, result, latency in fetch_stream(fallback, get_monitor_fields):
+        request_count += 1
+        latencies.append(latency)
+        if isinstance(result, Exception) or result[1] is None:
+            failed.append(pid)
+        else:
+            results[pid] = result[1]
+    
+    return results, failed, latencies, request_count
+
+# Retry lane: failed IDs get another go inside the same cycle
+FWGS_RETRY_ROUNDS = 2
+FWGS_RETRY_BASE_DELAY = 1.0    # seconds before the first retry round, doubles per round (±50% jitter)
+FWGS_RETRY_BUDGET = 10.0       # max seconds a cycle spends on retries
+
+async def retry_monitor_fields(failed, watcher_counts, budget=FWGS_RETRY_BUDGET):
+    """
+    Re-fetch failed products after a jittered backoff, watched products first,
+    until they succeed, the rounds run out or the time budget is spent.
+    Returns: (results {pid: fields}, still_failed [pids], request_count)
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget
+    results = {}
+    request_count = 0
+    # Most-watched first; fetch_stream starts items in order
+    remaining = sorted(failed, key=lambda pid: -watcher_counts.get(pid, 0))
+    
+    for attempt in range(FWGS_RETRY_ROUNDS):
+        if not remaining or fwgs_breakers["product"].is_open():
+            break
+        delay = FWGS_RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+        if loop.time() + delay >= deadline:
+            break
+        await asyncio.sleep(delay)
+        
+        # Watched products get their own pass so the budget is spent on them first
+        watched = [pid for pid in remaining if watcher_counts.get(pid)]
+        passes = [watched, [pid for pid in remaining if not watcher_counts.get(pid)]]
+        still_failed = []
+        for ids in passes:
+            if not ids:
+                continue
+            time_left = deadline - loop.time()
+            if time_left <= 0:
+                still_failed.extend(ids)
+                continue
+            try:
+                fetched, failed_ids, _, count = await asyncio.wait_for(fetch_monitor_fields(ids), time_left)
+            except asyncio.TimeoutError:
+                still_failed.extend(ids)
+                continue
+            results.update(fetched)
+            still_failed.extend(failed_ids)
+            request_count += count
+        remaining = still_failed
+    
+    return results, remaining, request_count
+
+def get_product_active_state(product_id):
+    """Get the last known active state from product_cache."""
     query = "SELECT last_qty FROM product_cache WHERE product_id = %s LIMIT 1;"
     conn = None
     try:
@@ -1819,71 +2701,125 @@ def set_product_categories(product_id, categories):
         if conn:
             return_db(conn)
 
-def update_store_quantity(product_id, store_id, quantity):
-    """Update the quantity for a product at a specific store."""
-    query = """
-        INSERT INTO product_quantity_cache (product_id, store_id, last_qty, last_checked)
-        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-        ON CONFLICT (product_id, store_id) DO UPDATE SET
-            last_qty = EXCLUDED.last_qty,
-            last_checked = CURRENT_TIMESTAMP;
+def users_watching_product(product_id):
+    """Get list of user_ids watching a specific product."""
+    query = "SELECT DISTINCT user_id FROM watchlist WHERE product_id = %s;"
+    conn = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(query, (product_id,))
+        results = cur.fetchall()
+        cur.close()
+        return [row[0] for row in results]
+    except Exception as e:
+        log(f"❌ Error getting watchers: {e}")
+        return []
+    finally:
+        if conn:
+            return_db(conn)
+
+def get_watcher_counts():
+    """Get {product_id: number of users watching it} in one query."""
+    query = "SELECT product_id, COUNT(DISTINCT user_id) FROM watchlist GROUP BY product_id;"
+    conn = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(query)
+        results = cur.fetchall()
+        cur.close()
+        return {str(row[0]): row[1] for row in results}
+    except Exception as e:
+        log(f"❌ Error getting watcher counts: {e}")
+        return {}
+    finally:
+        if conn:
+            return_db(conn)
+
+def record_product_changes(changes):
+    """Append detected changes to product_change_log.
+    
+    Args:
+        changes: list of (product_id, change_type) - change_type is a detector name or "stock"
+    Returns: True on success
     """
+    if not changes:
+        return True
+    
+    query = "INSERT INTO product_change_log (product_id, change_type) VALUES %s;"
     conn = None
     try:
         conn = get_db()
         cur = conn.cursor()
-        cur.execute(query, (product_id, store_id, int(quantity)))
+        execute_values(cur, query, changes, page_size=1000)
         conn.commit()
         cur.close()
+        return True
     except Exception as e:
         if conn:
             conn.rollback()
-        log(f"❌ Error updating store quantity: {e}")
+        log(f"❌ Error recording product changes: {e}")
+        return False
     finally:
         if conn:
             return_db(conn)
 
-def users_watching_product(product_id):
-    """Get list of user_ids watching a specific product."""
-    query = "SELECT DISTINCT user_id FROM watchlist WHERE product_id = %s;"
+def get_change_counts_by_hour(days):
+    """Count logged changes per product per hour-of-week (0 = Monday 00:00 UTC) over the last `days` days.
+    Returns: list of (product_id, hour_of_week, count)
+    """
+    query = """
+        SELECT product_id,
+               ((EXTRACT(ISODOW FROM changed_at)::int - 1) * 24 + EXTRACT(HOUR FROM changed_at)::int) AS hour_of_week,
+               COUNT(*)
+        FROM product_change_log
+        WHERE changed_at > CURRENT_TIMESTAMP - make_interval(days => %s)
+        GROUP BY 1, 2;
+    """
     conn = None
     try:
         conn = get_db()
         cur = conn.cursor()
-        cur.execute(query, (product_id,))
+        cur.execute(query, (days,))
         results = cur.fetchall()
         cur.close()
-        return [row[0] for row in results]
+        return [(str(pid), int(hour), int(count)) for pid, hour, count in results]
     except Exception as e:
-        log(f"❌ Error getting watchers: {e}")
+        log(f"❌ Error loading change history: {e}")
         return []
     finally:
         if conn:
             return_db(conn)
 
-def get_last_store_quantity(product_id, store_id):
-    """Get the last known quantity for a product at a specific store."""
-    query = """
-        SELECT last_qty 
-        FROM product_quantity_cache 
-        WHERE product_id = %s AND store_id = %s 
-        LIMIT 1;
+def prune_product_change_log(days):
+    """Delete product_change_log rows older than `days` days.
+    Returns: number of rows deleted (0 on error)
     """
+    query = "DELETE FROM product_change_log WHERE changed_at < CURRENT_TIMESTAMP - make_interval(days => %s);"
     conn = None
     try:
         conn = get_db()
         cur = conn.cursor()
-        cur.execute(query, (product_id, store_id))
-        result = cur.fetchone()
+        cur.execute(query, (days,))
+        deleted = cur.rowcount
+        conn.commit()
         cur.close()
-        return int(result[0]) if result else 0
+        return deleted
     except Exception as e:
-        log(f"❌ Error getting last quantity: {e}")
+        if conn:
+            conn.rollback()
+        log(f"❌ Error pruning change history: {e}")
         return 0
     finally:
         if conn:
             return_db(conn)
 
+async def prune_change_log_job(context: ContextTypes.DEFAULT_TYPE):
+    """Scheduled job: keep only the change history the change model reads."""
+    deleted = prune_product_change_log(CHANGE_HISTORY_DAYS)
+    log(f"🧹 Pruned {deleted} product_change_log rows older than {CHANGE_HISTORY_DAYS} days")
+
 def get_product_categories(product_id):
     """Get the last known categories from product_cache."""
     query = "SELECT category FROM product_cache WHERE product_id = %s LIMIT 1;"
@@ -1932,17 +2868,18 @@ def get_product_active_states_batch(product_ids):
 
 
 def set_product_active_states_batch(updates):
-    """Store active states for multiple products at once.
+    """Store active states for multiple products in one multi-row upsert.
     
     Args:
         updates: dict of {product_id: is_active}
+    Returns: True on success
     """
     if not updates:
-        return
+        return True
     
     query = """
         INSERT INTO product_cache (product_id, last_qty, updated)
-        VALUES (%s, %s, CURRENT_TIMESTAMP)
+        VALUES %s
         ON CONFLICT (product_id) DO UPDATE SET
             last_qty = EXCLUDED.last_qty,
             updated = CURRENT_TIMESTAMP;
@@ -1953,14 +2890,16 @@ def set_product_active_states_batch(updates):
         cur = conn.cursor()
         # Prepare batch data
         data = [(pid, 1 if active else 0) for pid, active in updates.items()]
-        cur.executemany(query, data)
+        execute_values(cur, query, data, template="(%s, %s, CURRENT_TIMESTAMP)", page_size=1000)
         conn.commit()
         cur.close()
         log(f"✅ Updated {len(updates)} product states in batch")
+        return True
     except Exception as e:
         if conn:
             conn.rollback()
         log(f"❌ Error setting batch product states: {e}")
+        return False
     finally:
         if conn:
             return_db(conn)
@@ -1997,17 +2936,18 @@ def get_product_categories_batch(product_ids):
 
 
 def set_product_categories_batch(updates):
-    """Store categories for multiple products at once.
+    """Store categories for multiple products in one multi-row upsert.
     
     Args:
         updates: dict of {product_id: [categories]}
+    Returns: True on success
     """
     if not updates:
-        return
+        return True
     
     query = """
         INSERT INTO product_cache (product_id, category, updated)
-        VALUES (%s, %s, CURRENT_TIMESTAMP)
+        VALUES %s
         ON CONFLICT (product_id) DO UPDATE SET
             category = EXCLUDED.category,
             updated = CURRENT_TIMESTAMP;
@@ -2021,402 +2961,827 @@ def set_product_categories_batch(updates):
             (pid, ",".join([str(c).lower() for c in cats]))
             for pid, cats in updates.items()
         ]
-        cur.executemany(query, data)
+        execute_values(cur, query, data, template="(%s, %s, CURRENT_TIMESTAMP)", page_size=1000)
         conn.commit()
         cur.close()
         log(f"✅ Updated {len(updates)} product categories in batch")
+        return True
     except Exception as e:
         if conn:
             conn.rollback()
         log(f"❌ Error setting batch categories: {e}")
+        return False
+    finally:
+        if conn:
+            return_db(conn)
+
+
+def get_product_cache_columns_batch(product_ids, columns):
+    """Get detector columns for multiple products at once.
+    Returns: {column: {product_id: value}} (NULLs left out)
+    """
+    if not product_ids or not columns:
+        return {column: {} for column in columns}
+    
+    # Column names come from MONITOR_DETECTORS, never from user input
+    query = f"""
+        SELECT product_id, {", ".join(columns)}
+        FROM product_cache 
+        WHERE product_id = ANY(%s);
+    """
+    conn = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(query, (product_ids,))
+        results = cur.fetchall()
+        cur.close()
+        values = {column: {} for column in columns}
+        for row in results:
+            for column, value in zip(columns, row[1:]):
+                if value is not None:
+                    values[column][row[0]] = value
+        return values
+    except Exception as e:
+        log(f"❌ Error getting batch detector values: {e}")
+        return {column: {} for column in columns}
+    finally:
+        if conn:
+            return_db(conn)
+
+
+def set_product_cache_column_batch(column, updates):
+    """Store one detector column for multiple products in one multi-row upsert.
+    
+    Args:
+        column: product_cache column (from MONITOR_DETECTORS)
+        updates: dict of {product_id: value}
+    Returns: True on success
+    """
+    if not updates:
+        return True
+    
+    query = f"""
+        INSERT INTO product_cache (product_id, {column}, updated)
+        VALUES %s
+        ON CONFLICT (product_id) DO UPDATE SET
+            {column} = EXCLUDED.{column},
+            updated = CURRENT_TIMESTAMP;
+    """
+    conn = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        data = [(pid, None if value is None else str(value)) for pid, value in updates.items()]
+        execute_values(cur, query, data, template="(%s, %s, CURRENT_TIMESTAMP)", page_size=1000)
+        conn.commit()
+        cur.close()
+        log(f"✅ Updated {len(updates)} product {column} values in batch")
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        log(f"❌ Error setting batch {column} values: {e}")
+        return False
     finally:
         if conn:
             return_db(conn)
 
 
+# ============================================================
+# MONITOR STATE (resident copy of the catalog + last known values)
+# ============================================================
+# Loaded once at startup and kept current in place by /add, /removeglobal, the daily
+# refresh and the monitors, so active_monitor never re-reads these tables per cycle.
+monitor_state = {
+    "products": {},     # {pid: {"Name", "product_full_url", "Allocated", "Lottery"}} - mirrors global_products
+    # One {pid: last value} dict per detector - mirrors its product_cache column
+    # ("active" -> last_qty as bool, "categories" -> category as a list, the rest as text)
+    **{detector.name: {} for detector in MONITOR_DETECTORS},
+    "loaded": False,
+    "synced_at": 0.0,   # time.time() of the last catalog read
+}
+MONITOR_CATALOG_RESYNC_SECONDS = 5 * 60  # Backstop - NOTIFY catalog_changes normally triggers a resync right away
+
+def load_monitor_state():
+    """Load the catalog and every detector's last known values from Postgres."""
+    import time
+    
+    products = get_all_global_products()
+    product_ids = list(products.keys())
+    monitor_state["products"] = products
+    monitor_state["active"] = get_product_active_states_batch(product_ids)
+    monitor_state["categories"] = get_product_categories_batch(product_ids)
+    extra = [detector for detector in MONITOR_DETECTORS if detector.name not in ("active", "categories")]
+    values = get_product_cache_columns_batch(product_ids, [detector.column for detector in extra])
+    for detector in extra:
+        monitor_state[detector.name] = values[detector.column]
+    monitor_state["loaded"] = bool(products)  # Empty could mean the DB was unreachable - try again later
+    monitor_state["synced_at"] = time.time()
+    log(f"✅ Monitor state loaded: {len(products)} products")
+
+def resync_monitor_catalog():
+    """Pick up products added/removed through another replica (one global_products read)."""
+    import time
+    
+    products = get_all_global_products()
+    monitor_state["synced_at"] = time.time()
+    if not products:
+        return  # Empty list or DB hiccup - keep what we have
+    removed = [pid for pid in monitor_state["products"] if pid not in products]
+    for pid in removed:
+        monitor_state_remove_product(pid)
+    added = [pid for pid in products if pid not in monitor_state["products"]]
+    monitor_state["products"].update(products)
+    if added or removed:
+        monitor_schedule.refreshed_at = None
+        log(f"🔄 Monitor catalog resync: +{len(added)} / -{len(removed)} products")
+
+def monitor_state_upsert_product(product_info):
+    """Called after a product is written to global_products."""
+    pid = str(product_info["ProductID"])
+    is_new = pid not in monitor_state["products"]
+    monitor_state["products"][pid] = {
+        "Name": product_info.get("Name"),
+        "product_full_url": product_info.get("product_full_url"),
+        "Allocated": product_info.get("Allocated"),
+        "Lottery": product_info.get("Lottery"),
+    }
+    if is_new:
+        monitor_schedule.refreshed_at = None  # Get it into the schedule on the next tick
+
+def monitor_state_remove_product(product_id):
+    """Called after a product is deleted from global_products."""
+    monitor_state["products"].pop(product_id, None)
+    for detector in MONITOR_DETECTORS:
+        monitor_state[detector.name].pop(product_id, None)
+    monitor_schedule.refreshed_at = None
+
+def monitor_state_set(name, updates):
+    """
+    Apply one detector's new values in memory, mirroring what its product_cache upsert
+    leaves behind (a brand new row reads back as inactive with no categories).
+    """
+    detector = DETECTORS_BY_NAME[name]
+    for pid, value in updates.items():
+        monitor_state[name][pid] = value
+        monitor_state["active"].setdefault(pid, False)
+        monitor_state["categories"].setdefault(pid, [])
+        if detector.info_key and pid in monitor_state["products"]:
+            monitor_state["products"][pid][detector.info_key] = value
+
+# ------------------------------------------------------------
+# Write-behind: monitor changes hit memory now and Postgres in batches
+# ------------------------------------------------------------
+STATE_FLUSH_SECONDS = 10      # flush dirty states at least this often
+STATE_FLUSH_MAX_DIRTY = 500   # ...or as soon as this many values are dirty
+
+state_write_buffer = {
+    "states": {detector.name: {} for detector in MONITOR_DETECTORS},  # {name: {pid: value}} waiting for detector.persist
+    "changes": [],      # [(pid, change_type)] waiting for record_product_changes
+    "last_flush": 0.0,
+}
+
+def _dirty_count():
+    return sum(len(values) for values in state_write_buffer["states"].values())
+
+def queue_state_writes(states=None, changes=None):
+    """Buffer monitor writes (latest value per product wins); flushes when the buffer gets big.
+    
+    Args:
+        states: {detector name: {pid: value}}
+        changes: [(pid, change_type)] for product_change_log
+    """
+    for name, values in (states or {}).items():
+        state_write_buffer["states"][name].update(values)
+    state_write_buffer["changes"].extend(changes or [])
+    if _dirty_count() >= STATE_FLUSH_MAX_DIRTY:
+        flush_state_writes()
+
+def flush_state_writes(force=False):
+    """
+    Write buffered states with one multi-row upsert per detector column.
+    Without force, only flushes once STATE_FLUSH_SECONDS have passed since the last flush
+    (or the buffer is over STATE_FLUSH_MAX_DIRTY). Rows that fail stay buffered for the next flush.
+    """
+    import time
+    
+    buffer = state_write_buffer
+    dirty = _dirty_count()
+    if not dirty and not buffer["changes"]:
+        return
+    if not force and dirty < STATE_FLUSH_MAX_DIRTY and time.time() - buffer["last_flush"] < STATE_FLUSH_SECONDS:
+        return
+    
+    states = buffer["states"]
+    buffer["states"] = {detector.name: {} for detector in MONITOR_DETECTORS}
+    changes, buffer["changes"] = buffer["changes"], []
+    buffer["last_flush"] = time.time()
+    
+    # Put back anything that failed, unless a newer value was queued meanwhile
+    for detector in MONITOR_DETECTORS:
+        values = states[detector.name]
+        if values and not detector.persist(values):
+            for pid, value in values.items():
+                buffer["states"][detector.name].setdefault(pid, value)
+    if not record_product_changes(changes):
+        buffer["changes"][:0] = changes
+
+# ============================================================
+# ACTIVE MONITOR SCHEDULE (hot / warm / cold tiers)
+# ============================================================
+MONITOR_TICK_SECONDS = 5          # active_monitor wakes up this often and polls whatever is due
+MONITOR_TIER_INTERVALS = {
+    "hot": 5,       # Many watchers, allocated/lottery, whiskey-release, recently flipped
+    "warm": 30,     # Watched or currently active
+    "cold": 300,    # Inactive and nobody watching
+}
+MONITOR_HOT_WATCHERS = 2          # watchers needed to be hot on popularity alone
+MONITOR_RECENT_FLIP_SECONDS = 6 * 60 * 60   # stay hot this long after an active/category change
+MONITOR_REFRESH_SECONDS = 60      # reload products/watchers/tiers from the DB this often
+
+# Learned intervals: scale each tier interval by how likely the product is to change this hour-of-week
+CHANGE_HISTORY_DAYS = 56              # 8 weeks of product_change_log
+CHANGE_MODEL_REFRESH_SECONDS = 60 * 60
+CHANGE_LIKELY_RATE = 0.25             # changed in this hour on >=1 in 4 weeks -> likely window
+CHANGE_CATALOG_PEAK = 2.0             # catalog-wide changes this hour >= 2x the hourly average -> likely window
+CHANGE_CATALOG_QUIET = 0.25           # catalog-wide changes this hour < 1/4 of average -> quiet window
+CHANGE_INTERVAL_FACTORS = {"likely": 0.5, "normal": 1.0, "quiet": 2.0}
+CHANGE_MIN_HISTORY = 50               # logged changes needed before the model kicks in
+
+def current_hour_of_week():
+    """Hour-of-week in UTC, 0 = Monday 00:00 (matches get_change_counts_by_hour)."""
+    now = datetime.now(timezone.utc)
+    return now.weekday() * 24 + now.hour
+
+
+class ChangeModel:
+    """Per product hour-of-week change counts, plus the catalog-wide profile for sparse products."""
+    
+    def __init__(self):
+        self.product_hours = {}   # {pid: {hour_of_week: count}}
+        self.catalog_hours = [0] * 168
+        self.total = 0
+        self.weeks = CHANGE_HISTORY_DAYS / 7
+        self.loaded_at = None
+    
+    def load(self, rows, now):
+        self.product_hours = {}
+        self.catalog_hours = [0] * 168
+        for pid, hour, count in rows:
+            self.product_hours.setdefault(pid, {})[hour] = count
+            self.catalog_hours[hour % 168] += count
+        self.total = sum(self.catalog_hours)
+        self.loaded_at = now
+    
+    def window(self, pid, hour_of_week):
+        """Return "likely", "normal" or "quiet" for this product in this hour."""
+        if self.total < CHANGE_MIN_HISTORY:
+            return "normal"  # Not enough history yet
+        product_count = self.product_hours.get(pid, {}).get(hour_of_week, 0)
+        catalog_ratio = self.catalog_hours[hour_of_week] / (self.total / 168)
+        if product_count / self.weeks >= CHANGE_LIKELY_RATE or catalog_ratio >= CHANGE_CATALOG_PEAK:
+            return "likely"
+        if product_count == 0 and catalog_ratio < CHANGE_CATALOG_QUIET:
+            return "quiet"
+        return "normal"
+
+
+def is_flag_set(value):
+    """True for the truthy spellings FWGS flags end up stored as ("True", "yes", "1")."""
+    return str(value).strip().lower() in ("true", "yes", "1")
+
+def get_product_tier(info, watchers, active, categories, last_flip, now):
+    """Pick the polling tier for one product."""
+    if (
+        watchers >= MONITOR_HOT_WATCHERS
+        or is_flag_set(info.get("Allocated"))
+        or is_flag_set(info.get("Lottery"))
+        or "whiskey-release" in (categories or [])
+        or (last_flip is not None and now - last_flip < MONITOR_RECENT_FLIP_SECONDS)
+    ):
+        return "hot"
+    if watchers > 0 or active or active is None:  # Never polled yet counts as warm
+        return "warm"
+    return "cold"
+
+
+class MonitorSchedule:
+    """
+    Next-due priority queue of products for active_monitor.
+    Heap entries are (due_at, pid); stale entries (product removed or rescheduled)
+    are skipped on pop by checking against due_at[pid].
+    """
+    
+    def __init__(self):
+        self.heap = []
+        self.due_at = {}           # {pid: next due time (loop clock)}
+        self.tiers = {}            # {pid: "hot"/"warm"/"cold"}
+        self.last_flip = {}        # {pid: loop time of the last detected change}
+        self.failures = {}         # {pid: consecutive failed polls}
+        self.refreshed_at = None
+        self.change_model = ChangeModel()
+    
+    def needs_refresh(self, now):
+        return self.refreshed_at is None or now - self.refreshed_at >= MONITOR_REFRESH_SECONDS
+    
+    def refresh(self, global_cache, watcher_counts, active_states, categories, now):
+        """
+        Re-tier every product. New products get their first poll on their pacing_offset slot
+        (within one interval), removed ones are dropped, and products whose tier got faster
+        are pulled forward to their next paced slot.
+        """
+        self.tiers = {
+            pid: get_product_tier(
+                info, watcher_counts.get(pid, 0), active_states.get(pid),
+                categories.get(pid), self.last_flip.get(pid), now
+            )
+            for pid, info in global_cache.items()
+        }
+        for pid in list(self.due_at):
+            if pid not in global_cache:
+                del self.due_at[pid]
+                self.last_flip.pop(pid, None)
+                self.failures.pop(pid, None)
+        for pid in global_cache:
+            if pid not in self.due_at:
+                # New product: first poll on its own slot (within one interval)
+                interval = self.interval(pid)
+                self._push(pid, now + (pacing_offset(pid, interval) - now) % interval)
+            elif self.due_at[pid] is None:
+                continue  # Being polled right now
+            else:
+                # Pull forward products whose new tier (or change window) is due sooner
+                paced = self.paced_due(pid, self.interval(pid), now)
+                if paced < self.due_at[pid]:
+                    self._push(pid, paced)
+        self.refreshed_at = now
+    
+    def paced_due(self, pid, interval, now):
+        """
+        Next slot for pid: its fixed pacing_offset within the interval, so a tier's products
+        are spread across the interval instead of all coming due on the same tick.
+        Slots less than half an interval away are skipped (the product was just polled).
+        """
+        due = now + (pacing_offset(pid, interval) - now) % interval
+        if due - now < interval / 2:
+            due += interval
+        return due
+    
+    def _push(self, pid, due):
+        self.due_at[pid] = due
+        heapq.heappush(self.heap, (due, pid))
+    
+    def pop_due(self, now):
+        """Take every product whose time has come (most overdue first)."""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due_time, pid = heapq.heappop(self.heap)
+            if self.due_at.get(pid) == due_time:
+                due.append(pid)
+                self.due_at[pid] = None  # Taken - reschedule() puts it back
+        return due
+    
+    def interval(self, pid, hour_of_week=None):
+        """Tier interval scaled by the learned change window for the current hour."""
+        if hour_of_week is None:
+            hour_of_week = current_hour_of_week()
+        window = self.change_model.window(pid, hour_of_week)
+        interval = MONITOR_TIER_INTERVALS[self.tiers[pid]] * CHANGE_INTERVAL_FACTORS[window]
+        return max(MONITOR_TICK_SECONDS, interval)
+    
+    def reschedule(self, pid, now, failed=False):
+        if pid not in self.tiers:
+            return  # Removed from the global list mid-poll
+        interval = self.interval(pid)
+        if failed:
+            # Retry soon, backing off to the tier interval if it keeps failing (e.g. a dead ID)
+            self.failures[pid] = self.failures.get(pid, 0) + 1
+            interval = min(interval, MONITOR_TICK_SECONDS * 2 ** (self.failures[pid] - 1))
+            self._push(pid, now + interval)
+            return
+        self.failures.pop(pid, None)
+        self._push(pid, self.paced_due(pid, interval, now))
+    
+    def mark_changed(self, pid, now):
+        """A product just flipped - keep it hot for a while."""
+        self.last_flip[pid] = now
+        if pid in self.tiers:
+            self.tiers[pid] = "hot"
+    
+    def tier_counts(self):
+        counts = {tier: 0 for tier in MONITOR_TIER_INTERVALS}
+        for tier in self.tiers.values():
+            counts[tier] += 1
+        return counts
+    
+    def poll_rates(self):
+        """Product polls per hour: (current schedule, fixed 30s polling of everything)."""
+        hour_of_week = current_hour_of_week()
+        current = sum(3600 / self.interval(pid, hour_of_week) for pid in self.tiers)
+        return current, len(self.tiers) * 3600 / 30
+    
+    def window_counts(self):
+        hour_of_week = current_hour_of_week()
+        counts = {window: 0 for window in CHANGE_INTERVAL_FACTORS}
+        for pid in self.tiers:
+            counts[self.change_model.window(pid, hour_of_week)] += 1
+        return counts
+    
+    def stats(self):
+        counts = self.tier_counts()
+        return ", ".join(f"{tier}={counts[tier]} every {MONITOR_TIER_INTERVALS[tier]}s" for tier in MONITOR_TIER_INTERVALS)
+
+
+monitor_schedule = MonitorSchedule()
+
 # ============================================================
 # ACTIVE AND CATEGORY MONITORING
 # ============================================================
 async def active_monitor(context: ContextTypes.DEFAULT_TYPE):
-    """Monitor products for active status changes - OPTIMIZED VERSION."""
+    """
+    Monitor products with every detector in MONITOR_DETECTORS (active, whiskey-release,
+    price, order limit, allocation, lottery) off one fetch per product. Runs every MONITOR_TICK_SECONDS and only polls the products monitor_schedule says are due,
+    so hot products are checked every few seconds and cold ones every few minutes.
+    """
     try:
-        import aiohttp
         import time
         
         start_time = time.time()
+        loop_now = asyncio.get_running_loop().time()
         bot = context.bot
+        schedule = monitor_schedule
         
-        # Get all global products from database
-        global_cache = get_all_global_products()
+        # Persist what earlier ticks buffered (no-op until STATE_FLUSH_SECONDS have passed)
+        flush_state_writes()
+        
+        # FWGS products API is down - don't pile up a sweep of instant failures
+        if fwgs_breakers["product"].is_open():
+            if not getattr(active_monitor, '_breaker_logged', False):
+                log("⏸️ Active monitor paused: FWGS products API circuit is open")
+                active_monitor._breaker_logged = True
+            return
+        active_monitor._breaker_logged = False
         
+        # Catalog + last known states live in memory (monitor_state); Postgres is only written to
+        if not monitor_state["loaded"]:
+            load_monitor_state()
+        elif time.time() - monitor_state["synced_at"] >= MONITOR_CATALOG_RESYNC_SECONDS:
+            resync_monitor_catalog()
+        global_cache = monitor_state["products"]
         if not global_cache:
             log("⚠️ No products in global list to monitor")
             return
         
-        product_ids = list(global_cache.keys())
-        # Only log start on first run or every 10 minutes
-        if not hasattr(active_monitor, '_last_log_time'):
-            active_monitor._last_log_time = 0
-        
-        should_log = (time.time() - active_monitor._last_log_time) > 1200  #20 minutes
-        
-        if should_log:
-            #log(f"⏰ Active monitor checking {len(product_ids)} products...")
-            active_monitor._last_log_time = time.time()
+        # Re-tier once a minute (watcher counts still come from the database)
+        if schedule.needs_refresh(loop_now):
+            if (schedule.change_model.loaded_at is None
+                    or loop_now - schedule.change_model.loaded_at >= CHANGE_MODEL_REFRESH_SECONDS):
+                schedule.change_model.load(get_change_counts_by_hour(CHANGE_HISTORY_DAYS), loop_now)
+            owned = {pid: info for pid, info in global_cache.items() if owns_product(pid)}
+            schedule.refresh(
+                owned, get_watcher_counts(),
+                monitor_state["active"], monitor_state["categories"], loop_now
+            )
         
-        # Get previous states in one batch query
-        prev_states = get_product_active_states_batch(product_ids)
+        product_ids = schedule.pop_due(loop_now)
+        if not product_ids:
+            return
         
-        # Fetch current states with optimized settings
-        BATCH_SIZE = 15
-        BATCH_DELAY = 0.5
-        BATCH_TIMEOUT = 10
+        # pop_due() marked these as in flight - they must go back in the queue even if this tick
+        # is cancelled (budget, leadership/shard change, /kill) or fails part way
         current_states = {}
-        failed_fetches = []
-        timeout_batches = 0
-        
-        # Configure session with connection limits
-        connector = aiohttp.TCPConnector(
-            limit=20,
-            limit_per_host=15,
-            ttl_dns_cache=300
-        )
-        
-        timeout = aiohttp.ClientTimeout(
-            total=3,
-            connect=1,
-            sock_read=2
-        )
-        
-        async with aiohttp.ClientSession(
-            timeout=timeout,
-            connector=connector
-        ) as session:
-            for i in range(0, len(product_ids), BATCH_SIZE):
-                batch = product_ids[i:i+BATCH_SIZE]
-                
-                try:
-                    tasks = [get_active_only(pid, session) for pid in batch]
-                    results = await asyncio.wait_for(
-                        asyncio.gather(*tasks, return_exceptions=True),
-                        timeout=BATCH_TIMEOUT
-                    )
-                    
-                    success_count = 0
-                    for result in results:
-                        if isinstance(result, Exception):
-                            continue
-                        
-                        pid, active_now = result
-                        if active_now is not None:
-                            current_states[pid] = active_now
-                            success_count += 1
-                        else:
-                            failed_fetches.append(pid)
-                    
-                    # Only log batch issues if significant problems
-                    if success_count < len(batch) * 0.5:  # Less than 50% success
-                        log(f"⚠️ Active batch issue: Only {success_count}/{len(batch)} succeeded")
-                
-                except asyncio.TimeoutError:
-                    log(f"❌ Active batch timed out after {BATCH_TIMEOUT}s")
-                    timeout_batches += 1
-                    failed_fetches.extend(batch)
-                
-                if i + BATCH_SIZE < len(product_ids):
-                    await asyncio.sleep(BATCH_DELAY)
+        try:
+            # Only log start on first run or every 10 minutes
+            if not hasattr(active_monitor, '_last_log_time'):
+                active_monitor._last_log_time = 0
+            
+            should_log = (time.time() - active_monitor._last_log_time) > 1200  #20 minutes
+            
+            if should_log:
+                log(f"📋 Active monitor schedule: {schedule.stats()}")
+                active_monitor._last_log_time = time.time()
+            
+            # Fetch every detector's fields once - bulk collection requests + per-product fallback,
+            # pacing is handled by the shared fwgs_limiter
+            fetched, failed_fetches, latencies, request_count = await fetch_monitor_fields(product_ids)
+            
+            # Retry what failed while there's still room in this tick
+            retry_budget = min(FWGS_RETRY_BUDGET, MONITOR_TICK_SECONDS * 2 - (time.time() - start_time))
+            if failed_fetches and retry_budget > 0:
+                first_failures = len(failed_fetches)
+                retried, failed_fetches, retry_requests = await retry_monitor_fields(
+                    failed_fetches, get_watcher_counts(), retry_budget
+                )
+                fetched.update(retried)
+                request_count += retry_requests
+                if should_log or len(failed_fetches) > len(product_ids) * 0.2:
+                    log(f"🔁 Retry lane recovered {len(retried)}/{first_failures} failed fetches")
+            
+            current_states = {pid: fields["active"] for pid, fields in fetched.items() if fields["active"] is not None}
+        finally:
+            # Put every polled product back in the queue at its tier's interval
+            done_at = asyncio.get_running_loop().time()
+            for pid in product_ids:
+                schedule.reschedule(pid, done_at, failed=pid not in current_states)
         
         # Calculate statistics
         elapsed = time.time() - start_time
         success_rate = len(current_states) / len(product_ids) * 100 if product_ids else 0
         
         # Only log if there are problems OR periodic check-in
-        has_issues = success_rate < 95 or elapsed > 20 or timeout_batches > 0
+        has_issues = success_rate < 95 or elapsed > 20
         
         if has_issues or should_log:
-            log(f"✅ Active monitor: {len(current_states)}/{len(product_ids)} products ({success_rate:.1f}%) in {elapsed:.2f}s")
-            
-            if timeout_batches > 0:
-                log(f"⚠️ {timeout_batches} batches timed out")
+            log(f"✅ Active monitor: {len(current_states)}/{len(product_ids)} due products ({success_rate:.1f}%) in {elapsed:.2f}s ({request_count} requests)")
+            log(f"⏱️ Active fetch time per request: {latency_summary(latencies)}")
+            log(
+                f"📶 FWGS limiter: {fwgs_limiter.stats()}, coalesced={fwgs_stats['coalesced']}, "
+                f"304s={fwgs_stats['not_modified']}, cache hits={fwgs_stats['ttl_hits']}"
+            )
+            log(f"🔌 FWGS circuits: {breaker_stats()}")
             
             if failed_fetches and len(failed_fetches) > len(product_ids) * 0.2:
                 log(f"⚠️ High failure rate: {len(failed_fetches)} active fetches failed")
         
-        # Check for changes and send alerts
-        changes = {}
-        alerts_to_send = []
+        # Run every detector over the same sweep (previous values come from memory)
+        updates, changes, alerts = run_detectors(fetched, global_cache, monitor_state)
         
-        for pid, active_now in current_states.items():
-            prev_active = prev_states.get(pid)
-            
-            # Only update if this is a new product OR status changed
-            if prev_active is None:
-                # First time seeing this product
-                changes[pid] = active_now
-            elif prev_active != active_now:
-                # Status changed
-                changes[pid] = active_now
-                
-                info = global_cache.get(pid, {})
-                name = info.get("Name", "Unknown")
-                url = info.get("product_full_url", "")
-                
-                # Log the status change
-                status = "ACTIVE" if active_now else "INACTIVE"
-                log(f"🔔 Status change: {name} is now {status}")
-                
-                if active_now:
-                    msg = f"🔥 <a href='{url}'>{name}</a> is ACTIVE!"
-                else:
-                    msg = f"⚠️ {name} is INACTIVE."
-                
-                watchers = users_watching_product(pid)
-                
-                for user_id in watchers:
-                    alerts_to_send.append((user_id, msg))
+        for pid, _ in changes:
+            schedule.mark_changed(pid, done_at)
+        for name, values in updates.items():
+            if values:
+                monitor_state_set(name, values)
+        queue_state_writes(states=updates, changes=changes)
         
-        # Update all changed states in one batch
         if changes:
-            set_product_active_states_batch(changes)
-            # Only log if changes are actual status changes (not first-time additions)
-            actual_changes = sum(1 for pid in changes if prev_states.get(pid) is not None)
-            if actual_changes > 0:
-                log(f"🔔 Detected {actual_changes} active state changes")
-        
-        # Send all alerts with rate limiting
-        if alerts_to_send:
-            log(f"📤 Sending {len(alerts_to_send)} active alerts...")
-            sent_count = 0
-            
-            for user_id, msg in alerts_to_send:
-                try:
-                    await bot.send_message(
-                        chat_id=int(user_id), 
-                        text=msg, 
-                        parse_mode="HTML"
-                    )
-                    sent_count += 1
-                    
-                    if sent_count % 20 == 0:
-                        await asyncio.sleep(1)
-                        
-                except Exception as e:
-                    log(f"❌ Alert failed for user {user_id}: {type(e).__name__}")
-            
-            log(f"✅ Sent {sent_count} active alerts")
+            counts = {}
+            for _, name in changes:
+                counts[name] = counts.get(name, 0) + 1
+            log("🔔 Detected changes: " + ", ".join(f"{name}={count}" for name, count in counts.items()))
+        
+        # Only log when the whiskey-release count changes
+        whiskey_release_count = sum(
+            1 for pid, cats in monitor_state["categories"].items()
+            if pid in global_cache and "whiskey-release" in cats
+        )
+        if whiskey_release_count != getattr(active_monitor, "_whiskey_release_count", 0):
+            log(f"📊 Currently {whiskey_release_count} products in whiskey-release")
+            active_monitor._whiskey_release_count = whiskey_release_count
+        
+        # Hand the alerts to the background sender: their state changes are already recorded,
+        # so a tick cancelled mid-send (budget) would lose the rest for good
+        for detector in MONITOR_DETECTORS:
+            alerts_to_send = [
+                (user_id, msg)
+                for pid, msg in alerts[detector.name]
+                for user_id in users_watching_product(pid)
+            ]
+            queue_monitor_alerts(bot, alerts_to_send, detector.label)
         
         # Only warn if job is taking too long
         if elapsed > 25:
-            log(f"⚠️ WARNING: Active monitor took {elapsed:.2f}s (close to 30s interval)")
+            log(f"⚠️ WARNING: Active monitor took {elapsed:.2f}s (hot products are due every {MONITOR_TIER_INTERVALS['hot']}s)")
         
     except Exception as e:
         log(f"❌ Error in active_monitor: {e}")
         log(f"Traceback: {traceback.format_exc()}")
 
-async def category_monitor(context: ContextTypes.DEFAULT_TYPE):
-    """Monitor products for category changes - OPTIMIZED VERSION."""
-    try:
-        import aiohttp
-        import time
-        
-        start_time = time.time()
-        bot = context.bot
-        
-        # Get all global products from database
-        global_cache = get_all_global_products()
-        
-        if not global_cache:
-            log("⚠️ No products in global list to monitor")
-            return
-        
-        product_ids = list(global_cache.keys())
-        
-        # Get previous categories in one batch query
-        prev_categories = get_product_categories_batch(product_ids)
-        
-        # Fetch current categories with optimized settings
-        BATCH_SIZE = 15
-        BATCH_DELAY = 0.5
-        BATCH_TIMEOUT = 10
-        current_categories = {}
-        failed_fetches = []
-        timeout_batches = 0
-        
-        # Configure session with connection limits and timeout
-        connector = aiohttp.TCPConnector(
-            limit=20,
-            limit_per_host=15,
-            ttl_dns_cache=300
-        )
-        
-        timeout = aiohttp.ClientTimeout(
-            total=3,
-            connect=1,
-            sock_read=2
-        )
-        
-        async with aiohttp.ClientSession(
-            timeout=timeout,
-            connector=connector
-        ) as session:
-            for i in range(0, len(product_ids), BATCH_SIZE):
-                batch = product_ids[i:i+BATCH_SIZE]
-                batch_num = i // BATCH_SIZE + 1
-                total_batches = (len(product_ids) + BATCH_SIZE - 1) // BATCH_SIZE
-                
-                # Process batch with timeout protection
-                try:
-                    # Fetch all in batch concurrently
-                    tasks = [get_category_only(pid, session) for pid in batch]
-                    
-                    # Add timeout for entire batch
-                    results = await asyncio.wait_for(
-                        asyncio.gather(*tasks, return_exceptions=True),
-                        timeout=BATCH_TIMEOUT
-                    )
-                    
-                    # Process results
-                    success_count = 0
-                    for result in results:
-                        if isinstance(result, Exception):
-                            continue
-                        
-                        pid, categories = result
-                        if categories is not None:
-                            current_categories[pid] = categories
-                            success_count += 1
-                        else:
-                            failed_fetches.append(pid)
-                    
-                    # Only log batch issues if significant problems
-                    if success_count < len(batch) * 0.5:
-                        log(f"⚠️ Category batch {batch_num}: Only {success_count}/{len(batch)} succeeded")
-                
-                except asyncio.TimeoutError:
-                    log(f"❌ Category batch {batch_num} timed out after {BATCH_TIMEOUT}s")
-                    timeout_batches += 1
-                    failed_fetches.extend(batch)
-                
-                # Delay between batches
-                if i + BATCH_SIZE < len(product_ids):
-                    await asyncio.sleep(BATCH_DELAY)
-        
-        # Log statistics
-        elapsed = time.time() - start_time
-        success_rate = len(current_categories) / len(product_ids) * 100 if product_ids else 0
-        
-        # Only log issues
-        if timeout_batches > 0:
-            log(f"⚠️ {timeout_batches} batches timed out")
-        
-        if failed_fetches and len(failed_fetches) > len(product_ids) * 0.2:
-            log(f"⚠️ High failure rate: {len(failed_fetches)} category fetches failed")
-        
-        # Check for new whiskey-release categories
-        updates = {}
-        alerts_to_send = []
-        whiskey_release_count = 0
-        
-        for pid, cats_now in current_categories.items():
-            prev_cats = prev_categories.get(pid, [])
-            
-            # Count products in whiskey-release
-            if "whiskey-release" in cats_now:
-                whiskey_release_count += 1
-            
-            # Only update database if categories actually changed
-            if sorted(cats_now) != sorted(prev_cats):
-                updates[pid] = cats_now
-                log(f"🔄 Category change for {pid}: {prev_cats} → {cats_now}")
+async def monitorstats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Owner only: show the active monitor schedule and what it saves over fixed 30s polling."""
+    if str(update.effective_user.id) != str(OWNER_CHAT_ID):
+        await update.message.reply_text("⛔ This command is only available to the owner.")
+        return
+    
+    if BOT_ROLE == "bot":
+        # The monitor runs in the worker - it answers this chat directly
+        enqueue_bot_job("monitorstats", {"chat_id": update.effective_chat.id})
+        await update.message.reply_text("⏳ Asked the worker for monitor stats...")
+        return
+    
+    await update.message.reply_text(build_monitorstats_text(), parse_mode="HTML")
+
+def build_monitorstats_text():
+    """HTML /monitorstats report for this process's monitor schedule."""
+    schedule = monitor_schedule
+    if not schedule.tiers:
+        return "⏳ Active monitor hasn't built its schedule yet."
+    
+    current, baseline = schedule.poll_rates()
+    saved = (1 - current / baseline) * 100 if baseline else 0
+    tiers = schedule.tier_counts()
+    windows = schedule.window_counts()
+    model = schedule.change_model
+    
+    msg = (
+        "📊 <b>Active Monitor Schedule</b>\n\n"
+        f"<b>Products:</b> {len(schedule.tiers)}"
+        + (f" (shard {shard_index + 1}/{shard_count})" if SHARDED_MONITOR else "") + "\n"
+        + "".join(f"• {tier}: {tiers[tier]} (every {MONITOR_TIER_INTERVALS[tier]}s)\n" for tier in MONITOR_TIER_INTERVALS)
+        + f"\n<b>This hour (UTC hour-of-week {current_hour_of_week()}):</b>\n"
+        f"• likely: {windows['likely']}  normal: {windows['normal']}  quiet: {windows['quiet']}\n"
+        f"• Change history: {model.total} changes over {CHANGE_HISTORY_DAYS} days"
+        + (" (model not active yet)" if model.total < CHANGE_MIN_HISTORY else "") + "\n\n"
+        f"<b>Product polls/hour:</b> {current:,.0f} vs {baseline:,.0f} at fixed 30s\n"
+        f"<b>Savings:</b> {saved:.1f}%\n"
+        f"<b>FWGS requests so far:</b> {fwgs_stats['requests']:,}"
+    )
+    return msg
+
+
+monitor_alert_queue = deque()  # (bot, [(user_id, msg)], label) waiting for the sender
+monitor_alert_task = None
+
+def queue_monitor_alerts(bot, alerts_to_send, label):
+    """Queue monitor alerts for the background sender (outside active_monitor's time budget)."""
+    global monitor_alert_task
+    if not alerts_to_send:
+        return
+    monitor_alert_queue.append((bot, alerts_to_send, label))
+    if monitor_alert_task is None or monitor_alert_task.done():
+        monitor_alert_task = asyncio.create_task(drain_monitor_alerts())
+
+async def drain_monitor_alerts():
+    """Send queued monitor alerts in the order they were detected."""
+    while monitor_alert_queue:
+        bot, alerts_to_send, label = monitor_alert_queue.popleft()
+        try:
+            await send_monitor_alerts(bot, alerts_to_send, label)
+        except Exception as e:
+            log(f"❌ Error sending {label} alerts: {e}")
+
+async def finish_monitor_alerts(timeout=15):
+    """Shutdown: give the sender a moment to deliver what's already queued."""
+    if monitor_alert_task and not monitor_alert_task.done():
+        try:
+            await asyncio.wait_for(monitor_alert_task, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            log(f"⚠️ Shutdown with {len(monitor_alert_queue)} monitor alert batches unsent")
+
+async def send_monitor_alerts(bot, alerts_to_send, label):
+    """Send monitor alerts [(user_id, msg)] with Telegram rate limiting."""
+    if not alerts_to_send:
+        return
+    
+    log(f"📤 Sending {len(alerts_to_send)} {label} alerts...")
+    sent_count = 0
+    
+    for user_id, msg in alerts_to_send:
+        try:
+            await bot.send_message(
+                chat_id=int(user_id), 
+                text=msg, 
+                parse_mode="HTML"
+            )
+            sent_count += 1
             
-            # Detect NEW whiskey-release category
-            if "whiskey-release" in cats_now and "whiskey-release" not in prev_cats:
-                info = global_cache.get(pid, {})
-                name = info.get("Name", pid)
-                url = info.get("product_full_url", "")
-                
-                log(f"🔔 NEW whiskey-release: {name}")
-                
-                if url:
-                    msg = f"📣 <a href='{url}'>{name}</a> added to Whiskey-Release!"
-                else:
-                    msg = f"📣 Whiskey-release added for {name}!"
+            if sent_count % 20 == 0:
+                await asyncio.sleep(1)
                 
-                watchers = users_watching_product(pid)
-                
-                for user_id in watchers:
-                    alerts_to_send.append((user_id, msg))
-        
-        # Only log if there ARE whiskey-release products
-        if whiskey_release_count > 0:
-            log(f"📊 Currently {whiskey_release_count} products in whiskey-release")
-        
-        # Only update database if there are actual changes
-        if updates:
-            set_product_categories_batch(updates)
-            log(f"✅ Updated categories for {len(updates)} products")
-        
-        if alerts_to_send:
-            log(f"📤 Sending {len(alerts_to_send)} whiskey-release alerts...")
-            sent_count = 0
-            
-            for user_id, msg in alerts_to_send:
-                try:
-                    await bot.send_message(
-                        chat_id=int(user_id),
-                        text=msg,
-                        parse_mode="HTML"
-                    )
-                    sent_count += 1
-                    
-                    if sent_count % 20 == 0:
-                        await asyncio.sleep(1)
-                        
-                except Exception as e:
-                    log(f"❌ Category alert failed for user {user_id}: {type(e).__name__}")
-            
-            log(f"✅ Sent {sent_count} whiskey-release alerts")
-        
-        # Only warn if slow
-        if elapsed > 240:
-            log(f"⚠️ WARNING: Category job took {elapsed:.2f}s (close to 5min interval)")
-        
-    except Exception as e:
-        log(f"❌ Error in category_monitor: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
+        except Exception as e:
+            log(f"❌ {label.capitalize()} alert failed for user {user_id}: {type(e).__name__}")
+    
+    log(f"✅ Sent {sent_count} {label} alerts")
 
 # ============================================================
 # HELPER FUNCTIONS FOR STOCK MONITORING
 # ============================================================
-def get_last_store_quantity(product_id, store_id):
-    """Get the last known quantity for a product at a specific store."""
+# ------------------------------------------------------------
+# Bulk stockStatus queries: many products x locations per request
+# ------------------------------------------------------------
+STOCK_URL_MAX = 1800  # Safe URL length for a stockStatus request
+
+def build_stock_url(product_ids, location_ids):
+    """stockStatus URL for several products and locations at once."""
+    products = ",".join(f"repositoryId:{pid}" for pid in product_ids)
+    return (
+        f"{BASE_URL}/ccstore/v1/stockStatus"
+        f"?actualStockStatus=true"
+        f"&expandStockDetails=true"
+        f"&products={products}"
+        f"&locationIds={','.join(location_ids)}"
+    )
+
+def build_stock_queries(product_ids, location_ids, max_url_len=STOCK_URL_MAX):
+    """
+    Pack products and locations into as few stockStatus requests as fit in max_url_len.
+    Locations are split first (so one product + its locations always fits), then as many
+    products as possible are packed into each request for every location group.
+    Returns: [(product_ids, location_ids, url), ...]
+    """
+    product_ids = list(dict.fromkeys(product_ids))
+    location_ids = list(dict.fromkeys(location_ids))
+    if not product_ids or not location_ids:
+        return []
+    
+    # Split locations so a single (longest) product still fits
+    longest_pid = max(product_ids, key=len)
+    location_groups = []
+    group = []
+    for loc in location_ids:
+        if group and len(build_stock_url([longest_pid], group + [loc])) > max_url_len:
+            location_groups.append(group)
+            group = []
+        group.append(loc)
+    if group:
+        location_groups.append(group)
+    
+    queries = []
+    for locs in location_groups:
+        batch = []
+        for pid in product_ids:
+            if batch and len(build_stock_url(batch + [pid], locs)) > max_url_len:
+                queries.append((batch, locs, build_stock_url(batch, locs)))
+                batch = []
+            batch.append(pid)
+        if batch:
+            queries.append((batch, locs, build_stock_url(batch, locs)))
+    return queries
+
+async def get_stock_query(query):
+    """
+    Run one packed stockStatus query and split the items back out per product and location.
+    Returns: {pid: {location_id: qty}} or None on error.
+    """
+    product_ids, location_ids, url = query
+    status_code, data = await fwgs_get_json(url, endpoint="stock")
+    if status_code != 200:
+        return None
+    
+    qty_by_product = {pid: {} for pid in product_ids}
+    for item in data.get("items", []) or []:
+        pid = str(item.get("productId") or "")
+        if pid not in qty_by_product:
+            if len(product_ids) != 1:
+                continue  # Can't tell which product this row belongs to
+            pid = product_ids[0]
+        qty_by_product[pid][str(item["locationId"])] = item.get("inStockQuantity", 0)
+    return qty_by_product
+
+async def get_stock_bulk(product_ids, location_ids):
+    """
+    Fetch stock for every product at every location with as few requests as possible.
+    Returns: (qty_by_product {pid: {location_id: qty}}, failed [pids], request_count)
+    """
+    queries = build_stock_queries(product_ids, location_ids)
+    qty_by_product = {}
+    failed = set()
+    
+    async for query, result, _ in fetch_stream(queries, get_stock_query):
+        if isinstance(result, Exception) or result is None:
+            failed.update(query[0])
+            continue
+        for pid, qty_map in result.items():
+            qty_by_product.setdefault(pid, {}).update(qty_map)
+    
+    # A product is only usable if every one of its location groups came back
+    for pid in failed:
+        qty_by_product.pop(pid, None)
+    return qty_by_product, sorted(failed), len(queries)
+
+def get_store_quantities_batch(product_ids):
+    """
+    Last known quantities for every store of several products, in one query.
+    Returns: {(product_id, store_id): qty}, or None on error (so callers don't read
+    a DB hiccup as "everything was 0" and alert on every store)
+    """
+    if not product_ids:
+        return {}
+    
     query = """
-        SELECT last_qty 
+        SELECT product_id, store_id, last_qty 
         FROM product_quantity_cache 
-        WHERE product_id = %s AND store_id = %s 
-        LIMIT 1;
+        WHERE product_id = ANY(%s);
     """
     conn = None
     try:
         conn = get_db()
         cur = conn.cursor()
-        cur.execute(query, (product_id, store_id))
-        result = cur.fetchone()
+        cur.execute(query, (list(product_ids),))
+        results = cur.fetchall()
         cur.close()
-        return int(result[0]) if result else 0
+        return {(pid, store_id): int(qty or 0) for pid, store_id, qty in results}
     except Exception as e:
-        log(f"❌ Error getting last quantity: {e}")
-        return 0
+        log(f"❌ Error getting batch store quantities: {e}")
+        return None
     finally:
         if conn:
             return_db(conn)
 
 
-def update_store_quantity(product_id, store_id, quantity):
-    """Update the quantity for a product at a specific store."""
+def set_store_quantities_batch(updates):
+    """Store changed quantities in one multi-row upsert.
+    
+    Args:
+        updates: dict of {(product_id, store_id): qty}
+    Returns: True on success
+    """
+    if not updates:
+        return True
+    
     query = """
         INSERT INTO product_quantity_cache (product_id, store_id, last_qty, last_checked)
-        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        VALUES %s
         ON CONFLICT (product_id, store_id) DO UPDATE SET
             last_qty = EXCLUDED.last_qty,
             last_checked = CURRENT_TIMESTAMP;
@@ -2425,13 +3790,17 @@ def update_store_quantity(product_id, store_id, quantity):
     try:
         conn = get_db()
         cur = conn.cursor()
-        cur.execute(query, (product_id, store_id, int(quantity)))
+        data = [(pid, store_id, int(qty)) for (pid, store_id), qty in updates.items()]
+        execute_values(cur, query, data, template="(%s, %s, %s, CURRENT_TIMESTAMP)", page_size=1000)
         conn.commit()
         cur.close()
+        log(f"✅ Updated {len(updates)} store quantities in batch")
+        return True
     except Exception as e:
         if conn:
             conn.rollback()
-        log(f"❌ Error updating store quantity: {e}")
+        log(f"❌ Error setting batch store quantities: {e}")
+        return False
     finally:
         if conn:
             return_db(conn)
@@ -2456,7 +3825,7 @@ def users_watching_product(product_id):
 
 def get_all_global_products():
     """Get all products from global_products table."""
-    query = "SELECT product_id, name, product_full_url FROM global_products;"
+    query = "SELECT product_id, name, product_full_url, allocated, lottery FROM global_products;"
     conn = None
     try:
         conn = get_db()
@@ -2464,8 +3833,11 @@ def get_all_global_products():
         cur.execute(query)
         results = cur.fetchall()
         cur.close()
-        # Return as dict: {product_id: {"Name": name, "product_full_url": url}, ...}
-        return {pid: {"Name": name, "product_full_url": url} for pid, name, url in results}
+        # Return as dict: {product_id: {"Name": name, "product_full_url": url, "Allocated": ..., "Lottery": ...}, ...}
+        return {
+            pid: {"Name": name, "product_full_url": url, "Allocated": allocated, "Lottery": lottery}
+            for pid, name, url, allocated, lottery in results
+        }
     except Exception as e:
         log(f"❌ Error getting global products: {e}")
         return {}
@@ -2473,12 +3845,61 @@ def get_all_global_products():
         if conn:
             return_db(conn)
 
+# Spread each 30-minute sweep's fetches over the first 20 minutes; 0 runs the whole sweep as one
+# burst (still bounded by FETCH_WINDOW and fwgs_limiter)
+INVENTORY_SPREAD_SECONDS = int(os.getenv("INVENTORY_SPREAD_SECONDS", 20 * 60))
+INVENTORY_SLOT_SECONDS = 60         # Products in the same one-minute slot with the same stores share requests
+STOCK_DIGEST_MAX_CHARS = 4000       # Under Telegram's 4096-character message limit
+INVENTORY_PROBE_WAIT_SECONDS = 1.0  # Retry delay for requests turned away while the stock breaker probes
+
+def get_inventory_plan():
+    """
+    Every (product, store) pair some user watches at some store they track, in one query.
+    Returns: {product_id: {store_id: [(user_id, product_name, city, address), ...]}}, or None on error
+    """
+    query = """
+        SELECT w.product_id, s.store_id, w.user_id, w.product_name, s.city, s.address1
+        FROM watchlist w
+        INNER JOIN stores s ON w.user_id = s.user_id
+        ORDER BY w.product_id, s.store_id, w.user_id;
+    """
+    conn = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(query)
+        results = cur.fetchall()
+        cur.close()
+    except Exception as e:
+        log(f"❌ Error building inventory plan: {e}")
+        return None
+    finally:
+        if conn:
+            return_db(conn)
+    
+    plan = {}
+    for product_id, store_id, user_id, product_name, city, address in results:
+        plan.setdefault(product_id, {}).setdefault(store_id, []).append((user_id, product_name, city, address))
+    return plan
+
+def build_inventory_batches(plan):
+    """
+    Group the plan into packed stock fetches: products whose pacing slot and store set match
+    go into one get_stock_bulk call, so each product is fetched once for all its stores.
+    Returns: [(offset, [product_ids], [store_ids]), ...] in offset order
+    """
+    batches = {}
+    for product_id, stores in plan.items():
+        slot = int(pacing_offset(product_id, INVENTORY_SPREAD_SECONDS) // INVENTORY_SLOT_SECONDS)
+        batches.setdefault((slot * INVENTORY_SLOT_SECONDS, tuple(sorted(stores))), []).append(product_id)
+    return [(offset, product_ids, list(store_ids)) for (offset, store_ids), product_ids in sorted(batches.items())]
+
 async def inventory_refresh_job(context: ContextTypes.DEFAULT_TYPE):
     """
-    Scheduled job: scans users' watchlists and stores, sends alerts on stock increases.
+    Scheduled job: checks stock for every watched product at the union of its watchers' stores
+    and fans stock increases out to each user watching that product at that store.
     Runs every 30 minutes during business hours.
     """
-    import aiohttp
     from datetime import datetime
     
     bot = context.bot
@@ -2491,117 +3912,222 @@ async def inventory_refresh_job(context: ContextTypes.DEFAULT_TYPE):
         is_business_hours = now >= BUSINESS_START or now <= BUSINESS_END
     else:
         is_business_hours = BUSINESS_START <= now <= BUSINESS_END
-
-    if not is_business_hours:
-        log(f"Outside business hours. Skipping inventory check.")
-        return
-    
-    log("⏰ Inventory refresh job starting...")
-    
-    # Get all users who have both watchlist items and stores
-    query = """
-        SELECT DISTINCT w.user_id, w.user_name
-        FROM watchlist w
-        INNER JOIN stores s ON w.user_id = s.user_id
-    """
-    conn = None
-    try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute(query)
-        users = cur.fetchall()
-        cur.close()
-    except Exception as e:
-        log(f"❌ Error getting users for inventory check: {e}")
+
+    if not is_business_hours:
+        log(f"Outside business hours. Skipping inventory check.")
         return
-    finally:
-        if conn:
-            return_db(conn)
     
-    if not users:
+    log("⏰ Inventory refresh job starting...")
+    
+    # Plan: distinct (product, store) pairs and who to tell about each
+    plan = get_inventory_plan()
+    if plan is None:
+        return
+    if not plan:
         log("No users with both watchlist and stores found.")
         return
     
-    log(f"Checking inventory for {len(users)} users...")
+    # Every last known quantity the sweep needs, loaded once and diffed in memory
+    last_qtys = get_store_quantities_batch(list(plan))
+    if last_qtys is None:
+        log("⏸️ Inventory refresh skipped: couldn't load last known quantities")
+        return
     
-    async with aiohttp.ClientSession() as session:
-        for user_id, user_name in users:
-            # Get user's watchlist
-            watchlist = get_user_watchlist(user_id)
-            if not watchlist:
-                continue
-            
-            # Get user's stores
-            stores = get_user_stores(user_id)
-            if not stores:
+    # Packed stockStatus requests for every batch, each tagged with its batch's pacing offset
+    queries = [
+        (offset, query)
+        for offset, product_ids, store_ids in build_inventory_batches(plan)
+        for query in build_stock_queries(product_ids, store_ids)
+    ]
+    pairs = sum(len(stores) for stores in plan.values())
+    log(
+        f"Checking {len(plan)} products at {pairs} product/store pairs with {len(queries)} requests "
+        f"over {INVENTORY_SPREAD_SECONDS // 60} minutes..."
+    )
+    
+    # Execute: concurrent fetches, each change fanned out to its watchers as results arrive
+    sweep = {
+        "stock_changes": set(),  # Products whose stock moved at any store this run (for product_change_log)
+        "qty_updates": {},       # Only changed (product, store) quantities - written once at the end
+        "checked": set(),        # Products whose every request came back
+        "failed": set(),
+        "digests": {},           # {user_id: {product_id: [alert, ...]}} - sent as each pacing slot completes
+        "sent_pairs": set(),     # (product, store) increases delivered to at least one watcher
+        "alerts": 0,
+        "messages": 0,
+        "latencies": [],
+    }
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        await run_inventory_queries(bot, plan, queries, last_qtys, sweep)
+        await send_stock_digests(bot, sweep)
+    finally:
+        # Increases no watcher was sent (budget cancel) stay unsaved so the next sweep alerts on
+        # them again; pairs someone already got are saved, so they aren't repeated to them
+        for products in sweep["digests"].values():
+            for alerts in products.values():
+                for alert in alerts:
+                    pair = (alert["product_id"], alert["store_id"])
+                    if pair not in sweep["sent_pairs"]:
+                        sweep["qty_updates"].pop(pair, None)
+        # Everything else is saved also on a breaker stop or budget cancel
+        set_store_quantities_batch(sweep["qty_updates"])
+        queue_state_writes(changes=[(pid, "stock") for pid in sorted(sweep["stock_changes"])])
+        checked_pairs = sum(len(plan[pid]) for pid in sweep["checked"])
+        log(
+            f"📦 Inventory sweep: {loop.time() - started:.1f}s, "
+            f"{len(sweep['checked'])}/{len(plan)} products and {checked_pairs}/{pairs} pairs checked "
+            f"({checked_pairs / pairs * 100:.0f}%), {len(sweep['failed'])} failed, "
+            f"{len(sweep['qty_updates'])} quantities changed, {sweep['alerts']} alerts in {sweep['messages']} messages | "
+            f"requests {latency_summary(sweep['latencies'])}"
+        )
+    log("✅ Inventory refresh job completed")
+
+async def run_inventory_queries(bot, plan, queries, last_qtys, sweep):
+    """
+    Run the sweep's stock requests through fetch_stream (each starts no earlier than its
+    pacing offset) and process every product as soon as all of its requests are back.
+    Digests go out whenever a pacing slot's requests have all finished, so an increase
+    found early in a paced sweep isn't held until the end.
+    """
+    loop = asyncio.get_running_loop()
+    sweep_start = loop.time()
+    stock_breaker = fwgs_breakers["stock"]
+    
+    # A product with many stores is split over several requests - wait for all of them
+    pending_requests = {}
+    qty_by_product = {}
+    slot_requests = {}  # {offset: requests not back yet}
+    for offset, (product_ids, _, _) in queries:
+        slot_requests[offset] = slot_requests.get(offset, 0) + 1
+        for pid in product_ids:
+            pending_requests[pid] = pending_requests.get(pid, 0) + 1
+    
+    async def fetch(item):
+        offset, query = item
+        delay = sweep_start + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        while True:
+            if stock_breaker.is_open():
+                raise FWGSUnavailable("FWGS stock API unavailable (circuit open)")
+            request_start = loop.time()  # Latency without the pacing wait
+            try:
+                result = await get_stock_query(query)
+            except FWGSUnavailable:
+                if stock_breaker.is_open():
+                    raise
+                # Half-open: another request is the probe - wait for its verdict and try again
+                await asyncio.sleep(INVENTORY_PROBE_WAIT_SECONDS)
                 continue
+            except Exception:
+                sweep["latencies"].append(loop.time() - request_start)
+                raise
+            sweep["latencies"].append(loop.time() - request_start)
+            return result
+    
+    async for (offset, query), result, _ in fetch_stream(queries, fetch):
+        if isinstance(result, FWGSUnavailable) and stock_breaker.is_open():
+            log("⏸️ Inventory refresh stopped: FWGS stock API circuit is open")
+            return
+        
+        ready = []
+        for pid in query[0]:
+            pending_requests[pid] -= 1
+            if isinstance(result, Exception) or result is None:
+                sweep["failed"].add(pid)
+                qty_by_product.pop(pid, None)
+            elif pid not in sweep["failed"]:
+                qty_by_product.setdefault(pid, {}).update(result.get(pid, {}))
+            if pending_requests[pid] == 0 and pid not in sweep["failed"]:
+                ready.append(pid)
+        if isinstance(result, Exception):
+            log(f"❌ Exception fetching stock for {len(query[0])} products: {result}")
+        
+        for product_id in ready:
+            sweep["checked"].add(product_id)
+            qty_map = qty_by_product.pop(product_id, {})
             
-            # Build location IDs string for API
-            location_ids_str = ",".join([store_id for store_id, _, _ in stores])
-            headers = {"User-Agent": "Mozilla/5.0"}
-            
-            # Check each product in watchlist
-            for product_id, product_name in watchlist:
-                # Build API URL
-                url = (
-                    f"{BASE_URL}/ccstore/v1/stockStatus"
-                    f"?actualStockStatus=true"
-                    f"&expandStockDetails=true"
-                    f"&products=repositoryId:{product_id}"
-                    f"&locationIds={location_ids_str}"
-                )
-                
-                # Fetch current stock levels
-                try:
-                    async with session.get(
-                        url, 
-                        timeout=aiohttp.ClientTimeout(total=10), 
-                        headers=headers
-                    ) as resp:
-                        if resp.status != 200:
-                            log(f"Failed to fetch stock for {product_id}")
-                            continue
-                        
-                        data = await resp.json(content_type=None)
-                        qty_map = {
-                            str(item["locationId"]): item.get("inStockQuantity", 0)
-                            for item in data.get("items", [])
-                        }
+            for store_id, watchers in plan[product_id].items():
+                current_qty = int(qty_map.get(store_id, 0))
                 
-                except Exception as e:
-                    log(f"❌ Exception fetching stock for {product_id}: {e}")
+                last_qty = last_qtys.get((product_id, store_id), 0)
+                if current_qty == last_qty:
                     continue
                 
-                # Check each store for stock increases
-                for store_id, city, address in stores:
-                    current_qty = int(qty_map.get(store_id, 0))
-                    
-                    # Get last known quantity from database
-                    last_qty = get_last_store_quantity(product_id, store_id)
-                    
-                    # Alert on stock increase
-                    if current_qty > last_qty:
-                        try:
-                            text = (
-                                "🔔 <b>Stock Added!</b>\n\n"
-                                f"<b>Product:</b> {product_id} - {product_name}\n"
-                                f"<b>Store:</b> {store_id} - {city} - {address}\n"
-                                f"<b>Quantity:</b> <b>{last_qty} ➜ {current_qty}</b>"
-                            )
-                            await bot.send_message(
-                                chat_id=int(user_id),
-                                text=text,
-                                parse_mode="HTML"
-                            )
-                            log(f"✅ Sent stock alert to {user_id} for {product_id} at store {store_id}")
-                        
-                        except Exception as e:
-                            log(f"❌ Failed to send stock alert to {user_id}: {e}")
-                    
-                    # Update quantity in database (always, even if no change)
-                    update_store_quantity(product_id, store_id, current_qty)
+                last_qtys[(product_id, store_id)] = current_qty
+                sweep["qty_updates"][(product_id, store_id)] = current_qty
+                sweep["stock_changes"].add(product_id)
+                
+                # Queue an alert for everyone watching this product at this store
+                if current_qty > last_qty:
+                    for user_id, product_name, city, address in watchers:
+                        sweep["digests"].setdefault(user_id, {}).setdefault(product_id, []).append({
+                            "product_id": product_id,
+                            "product_name": product_name,
+                            "store_id": store_id,
+                            "city": city,
+                            "address": address,
+                            "last_qty": last_qty,
+                            "current_qty": current_qty,
+                        })
+        
+        slot_requests[offset] -= 1
+        if slot_requests[offset] == 0 and sweep["digests"]:
+            await send_stock_digests(bot, sweep)
+
+def build_stock_digest(products, max_chars=STOCK_DIGEST_MAX_CHARS):
+    """
+    Render one user's stock increases grouped by product.
+    Returns: list of HTML messages, split at line boundaries to stay under max_chars
+    """
+    count = sum(len(alerts) for alerts in products.values())
+    header = f"🔔 <b>Stock Added!</b> ({count} update{'s' if count != 1 else ''})\n"
     
-    log("✅ Inventory refresh job completed")
+    lines = []
+    for product_id in sorted(products):
+        alerts = sorted(products[product_id], key=lambda alert: alert["store_id"])
+        lines.append(f"\n<b>{product_id} - {alerts[0]['product_name']}</b>")
+        for alert in alerts:
+            lines.append(
+                f"• {alert['store_id']} - {alert['city']} - {alert['address']}: "
+                f"<b>{alert['last_qty']} ➜ {alert['current_qty']}</b>"
+            )
+    
+    messages = []
+    message = header
+    for line in lines:
+        if len(message) + len(line) + 1 > max_chars:
+            messages.append(message)
+            message = ""
+        message += line + "\n"
+    if message:
+        messages.append(message)
+    return messages
+
+async def send_stock_digests(bot, sweep):
+    """Send each user one grouped stock alert (or a few, if it's long) for what's been found so far."""
+    for user_id in list(sweep["digests"]):
+        products = sweep["digests"][user_id]
+        count = sum(len(alerts) for alerts in products.values())
+        try:
+            for text in build_stock_digest(products):
+                await bot.send_message(
+                    chat_id=int(user_id),
+                    text=text,
+                    parse_mode="HTML"
+                )
+                sweep["messages"] += 1
+            sweep["alerts"] += count
+            sweep["sent_pairs"].update(
+                (alert["product_id"], alert["store_id"]) for alerts in products.values() for alert in alerts
+            )
+            log(f"✅ Sent {count} stock alerts to {user_id} for {len(products)} products")
+        
+        except Exception as e:
+            log(f"❌ Failed to send stock alerts to {user_id}: {e}")
+        del sweep["digests"][user_id]
 
 # ============================================================
 # DATABASE OPERATIONS - FWGS STORES
@@ -2722,8 +4248,6 @@ async def statestock_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return
     
-    import aiohttp
-    
     if not context.args:
         await update.message.reply_text("Usage: /statestock <product_id>")
         return
@@ -2739,47 +4263,37 @@ async def statestock_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     log(f"Checking stock at {len(store_items)} stores for product {pid}")
     
-    headers = {"User-Agent": "Mozilla/5.0"}
     stock_results = []
     
     CHUNK_SIZE = 50
     
-    async with aiohttp.ClientSession() as session:
-        for i in range(0, len(store_items), CHUNK_SIZE):
-            chunk = store_items[i:i + CHUNK_SIZE]
-            location_ids_str = ",".join([store_id for store_id, _, _ in chunk])
-            url = FWGS_STOCKSTATUS_URL.format(pid=pid, store=location_ids_str)
-            
-            try:
-                async with session.get(
-                    url, 
-                    headers=headers, 
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as resp:
-                    if resp.status == 200:
-                        data = await resp.json(content_type=None)
-                        store_lookup = {
-                            store_id: (city, address1) 
-                            for store_id, city, address1 in chunk
-                        }
-                        
-                        for item in data.get("items", []):
-                            loc_id = str(item["locationId"])
-                            qty = item.get("inStockQuantity", 0)
-                            
-                            if qty > 0:
-                                city, address = store_lookup.get(loc_id, ("Unknown", "Unknown"))
-                                stock_results.append(f"<b>{qty}</b> in stock — {loc_id} — {city}")
+    for i in range(0, len(store_items), CHUNK_SIZE):
+        chunk = store_items[i:i + CHUNK_SIZE]
+        location_ids_str = ",".join([store_id for store_id, _, _ in chunk])
+        url = FWGS_STOCKSTATUS_URL.format(pid=pid, store=location_ids_str)
+        
+        try:
+            status_code, data = await fwgs_get_json(url, endpoint="stock")
+            if status_code == 200:
+                store_lookup = {
+                    store_id: (city, address1) 
+                    for store_id, city, address1 in chunk
+                }
+                
+                for item in data.get("items", []):
+                    loc_id = str(item["locationId"])
+                    qty = item.get("inStockQuantity", 0)
                     
-                    elif resp.status != 204:
-                        log(f"⚠️ Failed chunk {i//CHUNK_SIZE + 1} (status: {resp.status})")
-                        
-            except Exception as e:
-                log(f"❌ Error fetching stock chunk {i//CHUNK_SIZE + 1}: {e}")
-                continue
+                    if qty > 0:
+                        city, address = store_lookup.get(loc_id, ("Unknown", "Unknown"))
+                        stock_results.append(f"<b>{qty}</b> in stock — {loc_id} — {city}")
             
-            if i + CHUNK_SIZE < len(store_items):
-                await asyncio.sleep(0.3)
+            elif status_code != 204:
+                log(f"⚠️ Failed chunk {i//CHUNK_SIZE + 1} (status: {status_code})")
+                
+        except Exception as e:
+            log(f"❌ Error fetching stock chunk {i//CHUNK_SIZE + 1}: {e}")
+            continue
     
     stock_results.sort(key=lambda x: int(x.split("<b>")[1].split("</b>")[0]), reverse=True)
     
@@ -3512,8 +5026,12 @@ def remove_from_global_products(product_id):
         cur = conn.cursor()
         cur.execute(query, (product_id,))
         result = cur.fetchone()
+        if result:
+            cur.execute("SELECT pg_notify(%s, %s);", (CATALOG_CHANNEL, str(product_id)))
         conn.commit()
         cur.close()
+        if result:
+            monitor_state_remove_product(product_id)
         return result[0] if result else None  # Returns product name if deleted
     except Exception as e:
         if conn:
@@ -3723,43 +5241,530 @@ async def cloneglobal_with_confirm_handler(update: Update, context: ContextTypes
 # SCHEDULER & RUNNER
 # ============================================================
 
-main_loop = None
+# ------------------------------------------------------------
+# Leader election: with several replicas, only the holder of a Postgres
+# advisory lock runs scheduled jobs; every replica still handles commands.
+# ------------------------------------------------------------
+LEADER_LOCK_ID = 0x46574753           # pg advisory lock key ("FWGS")
+LEADER_HEARTBEAT_SECONDS = 5          # standbys retry the lock this often
+REPLICA_ID = f"{socket.gethostname()}:{os.getpid()}"
 
-def schedule_coroutine(coro_func, *args, **kwargs):
-    """Schedule an async coroutine to run in the main asyncio loop."""
-    if main_loop is None:
-        raise RuntimeError("Main loop not set; cannot schedule coroutine.")
-    future = asyncio.run_coroutine_threadsafe(
-        coro_func(*args, **kwargs), 
-        main_loop
-    )
-    def _cb(fut):
+leader_conn = None   # Pooled connection held for the life of the lock (session-level lock)
+is_leader = False
+
+def _drop_leader_conn():
+    global leader_conn
+    if leader_conn is not None:
+        try:
+            connection_pool.putconn(leader_conn, close=True)
+        except Exception:
+            pass
+        leader_conn = None
+
+def check_leadership():
+    """
+    Try to take the advisory lock (standby) or make sure our lock connection is still alive (leader).
+    The lock dies with its connection, so a crashed leader's lock is freed by Postgres and a
+    standby picks it up on its next heartbeat.
+    Returns: True if this replica is the leader
+    """
+    global leader_conn, is_leader
+    try:
+        if leader_conn is None or leader_conn.closed:
+            is_leader = False  # A new connection never holds the old lock
+            leader_conn = get_db()
+            leader_conn.autocommit = True
+        cur = leader_conn.cursor()
+        if is_leader:
+            cur.execute("SELECT 1;")
+        else:
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (LEADER_LOCK_ID,))
+            is_leader = bool(cur.fetchone()[0])
+        cur.close()
+    except Exception as e:
+        if is_leader:
+            log(f"❌ Lost leader lock connection: {e}")
+        is_leader = False
+        _drop_leader_conn()
+    return is_leader
+
+def release_leadership():
+    """Unlock and give the connection back (shutdown) so a standby takes over immediately."""
+    global is_leader
+    if leader_conn is not None and is_leader:
+        try:
+            cur = leader_conn.cursor()
+            cur.execute("SELECT pg_advisory_unlock(%s);", (LEADER_LOCK_ID,))
+            cur.close()
+        except Exception:
+            pass
+    is_leader = False
+    _drop_leader_conn()
+
+def polling_error_callback(error):
+    """
+    getUpdates errors. Telegram allows one long-poll per bot token, so with several replicas
+    the pollers keep interrupting each other (Conflict) - updates still get handled once,
+    by whichever replica's poll receives them, so only note it occasionally.
+    """
+    import time
+    
+    if isinstance(error, Conflict):
+        if time.time() - getattr(polling_error_callback, "_last_conflict_log", 0) > 600:
+            log("ℹ️ getUpdates conflict - another replica is polling the same bot token")
+            polling_error_callback._last_conflict_log = time.time()
+        return
+    log(f"❌ Error while polling for updates: {error}")
+
+async def leader_heartbeat():
+    """Runs on every replica every LEADER_HEARTBEAT_SECONDS."""
+    was_leader = is_leader
+    check_leadership()
+    if is_leader and not was_leader:
+        log(f"👑 {REPLICA_ID} is now the leader - running scheduled jobs")
+        if not SHARDED_MONITOR:
+            # Another replica may have changed things while we were standby - start from the database
+            monitor_state["loaded"] = False
+            monitor_schedule.refreshed_at = None
+    elif was_leader and not is_leader:
+        log(f"⚠️ {REPLICA_ID} lost leadership - stopping scheduled jobs")
+        await stop_supervised_jobs(leader_only=True)
+        if SHARDED_MONITOR:
+            return  # The monitor (and its buffered writes) isn't tied to leadership
+        # The new leader reloads from the database; flushing our older values later would overwrite its writes
+        dropped = sum(len(values) for values in state_write_buffer["states"].values())
+        state_write_buffer["states"] = {detector.name: {} for detector in MONITOR_DETECTORS}
+        state_write_buffer["changes"] = []
+        if dropped:
+            log(f"⚠️ Dropped {dropped} unflushed monitor states")
+
+
+# ------------------------------------------------------------
+# Sharded monitor workers: with SHARDED_MONITOR=1 every replica runs active_monitor
+# on its own hash partition of global_products and its share of the request budget.
+# ------------------------------------------------------------
+SHARDED_MONITOR = os.getenv("SHARDED_MONITOR", "0") == "1"
+SHARD_HEARTBEAT_SECONDS = 5
+SHARD_WORKER_TIMEOUT = 20     # a worker not seen for this long is dropped from the ring
+
+shard_index = 0
+shard_count = 1
+
+def owns_product(product_id):
+    """True if this worker's partition includes the product (always, when not sharded)."""
+    if shard_count <= 1:
+        return True
+    return zlib.crc32(str(product_id).encode()) % shard_count == shard_index
+
+def get_live_shard_workers():
+    """Heartbeat our row and return the sorted ids of every live worker (None on DB error)."""
+    conn = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO monitor_workers (worker_id, last_seen)
+            VALUES (%s, CURRENT_TIMESTAMP)
+            ON CONFLICT (worker_id) DO UPDATE SET last_seen = CURRENT_TIMESTAMP;
+        """, (REPLICA_ID,))
+        cur.execute("""
+            DELETE FROM monitor_workers
+            WHERE last_seen < CURRENT_TIMESTAMP - INTERVAL '1 hour';
+        """)
+        cur.execute("""
+            SELECT worker_id FROM monitor_workers
+            WHERE last_seen > CURRENT_TIMESTAMP - make_interval(secs => %s)
+            ORDER BY worker_id;
+        """, (SHARD_WORKER_TIMEOUT,))
+        workers = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        cur.close()
+        return workers
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        log(f"❌ Error in monitor worker heartbeat: {e}")
+        return None
+    finally:
+        if conn:
+            return_db(conn)
+
+def deregister_shard_worker():
+    """Remove our row on shutdown so the others rebalance right away."""
+    conn = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM monitor_workers WHERE worker_id = %s;", (REPLICA_ID,))
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        log(f"❌ Error removing monitor worker: {e}")
+    finally:
+        if conn:
+            return_db(conn)
+
+async def shard_heartbeat():
+    """Refresh worker membership; on a change, take the new partition and budget share."""
+    global shard_index, shard_count
+    workers = get_live_shard_workers()
+    if not workers or REPLICA_ID not in workers:
+        return  # DB trouble - keep the current partition
+    index, count = workers.index(REPLICA_ID), len(workers)
+    if (index, count) == (shard_index, shard_count):
+        return
+    
+    # Persist what we observed for products we may be handing over, then start clean:
+    # products we pick up were last written by another worker
+    flush_state_writes(force=True)
+    shard_index, shard_count = index, count
+    fwgs_limiter.set_share(1 / count)
+    monitor_state["loaded"] = False
+    monitor_schedule.refreshed_at = None
+    log(f"🧩 Monitor shard {index + 1}/{count} ({REPLICA_ID}), FWGS budget max {fwgs_limiter.max_rate:.0f} req/s")
+
+
+class SupervisedJob:
+    """
+    Owns the lifecycle of one scheduled coroutine.
+    The scheduler calls fire(), which returns straight away; the supervisor makes sure only one
+    run is in flight (overruns are skipped, or queued to run once right after), cancels runs
+    that exceed their time budget, and keeps lag/overrun/duration stats for /jobstats.
+    """
+    
+    def __init__(self, name, coro_func, budget, interval=None, overrun="skip", leader_only=True):
+        self.name = name
+        self.leader_only = leader_only  # Standby replicas don't run it
+        self.coro_func = coro_func
+        self.budget = budget          # seconds a run may take before it's cancelled
+        self.interval = interval      # expected seconds between fires (for lag stats)
+        self.overrun = overrun        # "skip" or "queue"
+        self.task = None
+        self.queued_args = None
+        self.last_fired = None
+        self.lags = deque(maxlen=200)       # seconds the trigger fired later than expected
+        self.durations = deque(maxlen=200)
+        self.runs = 0
+        self.skipped = 0
+        self.queued = 0
+        self.timeouts = 0
+        self.failures = 0
+    
+    async def fire(self, *args):
+        """Scheduler entry point - never blocks on the job itself."""
+        if self.leader_only and not is_leader:
+            return
+        now = asyncio.get_running_loop().time()
+        if self.interval and self.last_fired is not None:
+            self.lags.append(max(0.0, now - self.last_fired - self.interval))
+        self.last_fired = now
+        
+        if self.task and not self.task.done():
+            if self.overrun == "queue" and self.queued_args is None:
+                self.queued_args = args
+                self.queued += 1
+            else:
+                self.skipped += 1
+                if self.skipped == 1 or self.skipped % 100 == 0:
+                    log(f"⏭️ {self.name} still running, skipped overlapping run ({self.skipped} so far)")
+            return
+        self._start(args)
+    
+    def _start(self, args):
+        self.task = asyncio.create_task(self._run(args))
+    
+    async def _run(self, args):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.runs += 1
         try:
-            fut.result()
+            await asyncio.wait_for(self.coro_func(*args), self.budget)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            log(f"⏱️ {self.name} exceeded its {self.budget:.0f}s budget and was cancelled")
         except Exception as e:
-            log(f"❌ Exception in scheduled job {getattr(coro_func, '__name__', str(coro_func))}: {e}")
-    future.add_done_callback(_cb)
-    return future
+            self.failures += 1
+            log(f"❌ Exception in scheduled job {self.name}: {e}")
+        finally:
+            self.durations.append(loop.time() - started)
+            if self.queued_args is not None:
+                args, self.queued_args = self.queued_args, None
+                self._start(args)
+    
+    async def stop(self):
+        """Cancel the in-flight run (shutdown)."""
+        self.queued_args = None
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+    
+    def stats(self):
+        running = "running" if self.task and not self.task.done() else "idle"
+        return (
+            f"{self.name} ({running}): runs={self.runs}, skipped={self.skipped}, queued={self.queued}, "
+            f"timeouts={self.timeouts}, failures={self.failures}, "
+            f"duration {latency_summary(self.durations)}, lag {latency_summary(self.lags)}"
+        )
+
+
+supervised_jobs = {}  # {name: SupervisedJob}
+
+def supervise(coro_func, budget, interval=None, overrun="skip", leader_only=True):
+    """Register a coroutine with the job supervisor; schedule the returned job's fire()."""
+    job = SupervisedJob(coro_func.__name__, coro_func, budget, interval, overrun, leader_only)
+    supervised_jobs[job.name] = job
+    return job
+
+async def stop_supervised_jobs(leader_only=False):
+    for job in supervised_jobs.values():
+        if job.leader_only or not leader_only:
+            await job.stop()
+
+async def jobstats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Owner only: run/overrun/timeout counts, durations and scheduling lag per job."""
+    if str(update.effective_user.id) != str(OWNER_CHAT_ID):
+        await update.message.reply_text("⛔ This command is only available to the owner.")
+        return
+    
+    if BOT_ROLE == "bot":
+        enqueue_bot_job("jobstats", {"chat_id": update.effective_chat.id})
+        await update.message.reply_text("⏳ Asked the worker for job stats...")
+        return
+    
+    await update.message.reply_text(build_jobstats_text())
+
+def build_jobstats_text():
+    """Plain-text /jobstats report for this process."""
+    if not supervised_jobs:
+        return "No scheduled jobs registered."
+    
+    role = "leader" if is_leader else "standby (jobs run on the leader)"
+    return (
+        f"🗓️ Scheduled jobs on {REPLICA_ID} - {role}\n\n"
+        + "\n\n".join(job.stats() for job in supervised_jobs.values())
+    )
+
+# ------------------------------------------------------------
+# Bot <-> worker messaging through Postgres
+# - bot_jobs: outbox of requests the bot role hands to the worker (claimed once, SKIP LOCKED)
+# - NOTIFY bot_jobs wakes the worker; NOTIFY catalog_changes tells every worker that
+#   /add or /removeglobal changed global_products, so it resyncs without waiting 5 minutes
+# ------------------------------------------------------------
+BOT_JOBS_CHANNEL = "bot_jobs"
+CATALOG_CHANNEL = "catalog_changes"
+BOT_JOBS_SWEEP_SECONDS = 30  # Fallback in case a NOTIFY was missed (listener reconnecting)
+
+listen_conn = None  # Dedicated pooled connection in LISTEN mode
+bot_jobs_running = False
+
+def enqueue_bot_job(kind, payload):
+    """Queue a job for the worker and wake it up. Returns: True if queued."""
+    conn = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("INSERT INTO bot_jobs (kind, payload) VALUES (%s, %s);", (kind, json.dumps(payload)))
+        cur.execute("SELECT pg_notify(%s, %s);", (BOT_JOBS_CHANNEL, kind))
+        conn.commit()  # NOTIFY is delivered on commit, so the row is always visible to the listener
+        cur.close()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        log(f"❌ Error queueing {kind} job: {e}")
+        return False
+    finally:
+        if conn:
+            return_db(conn)
+
+def claim_bot_jobs(limit=50):
+    """
+    Claim waiting jobs for this process and drop ones finished over a day ago.
+    Returns: [(id, kind, payload dict)]
+    """
+    query = """
+        UPDATE bot_jobs SET claimed_at = CURRENT_TIMESTAMP, claimed_by = %s
+        WHERE id IN (
+            SELECT id FROM bot_jobs
+            WHERE claimed_at IS NULL
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, kind, payload;
+    """
+    conn = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(query, (REPLICA_ID, limit))
+        rows = cur.fetchall()
+        cur.execute("DELETE FROM bot_jobs WHERE claimed_at < CURRENT_TIMESTAMP - INTERVAL '1 day';")
+        conn.commit()
+        cur.close()
+        return [(job_id, kind, json.loads(payload or "{}")) for job_id, kind, payload in sorted(rows)]
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        log(f"❌ Error claiming bot jobs: {e}")
+        return []
+    finally:
+        if conn:
+            return_db(conn)
+
+async def process_bot_jobs(app):
+    """Answer every waiting bot job. Single-flight, so a burst of NOTIFYs collapses into one pass."""
+    global bot_jobs_running
+    if bot_jobs_running:
+        return
+    if not (is_leader or SHARDED_MONITOR):
+        return  # Standbys have no monitor schedule or job stats worth reporting
+    bot_jobs_running = True
+    try:
+        for job_id, kind, payload in claim_bot_jobs():
+            try:
+                if kind == "monitorstats":
+                    await app.bot.send_message(chat_id=payload["chat_id"], text=build_monitorstats_text(), parse_mode="HTML")
+                elif kind == "jobstats":
+                    await app.bot.send_message(chat_id=payload["chat_id"], text=build_jobstats_text())
+                else:
+                    log(f"⚠️ Unknown bot job {job_id}: {kind}")
+            except Exception as e:
+                log(f"❌ Bot job {job_id} ({kind}) failed: {e}")
+    finally:
+        bot_jobs_running = False
+
+def _on_notify(app):
+    """Event loop reader callback for the LISTEN connection."""
+    try:
+        listen_conn.poll()
+    except Exception as e:
+        log(f"❌ LISTEN connection lost: {e}")
+        stop_notification_listener()
+        return
+    
+    wake_jobs = False
+    while listen_conn.notifies:
+        notify = listen_conn.notifies.pop(0)
+        if notify.channel == CATALOG_CHANNEL:
+            monitor_state["synced_at"] = 0.0  # One resync on the next monitor tick, however many arrived
+        elif notify.channel == BOT_JOBS_CHANNEL:
+            wake_jobs = True
+    if wake_jobs:
+        asyncio.create_task(process_bot_jobs(app))
+
+def start_notification_listener(app):
+    """LISTEN for bot jobs and catalog changes; the event loop wakes us when one arrives."""
+    global listen_conn
+    if listen_conn is not None:
+        return
+    try:
+        listen_conn = get_db()
+        listen_conn.autocommit = True
+        cur = listen_conn.cursor()
+        cur.execute(f"LISTEN {BOT_JOBS_CHANNEL}; LISTEN {CATALOG_CHANNEL};")
+        cur.close()
+        asyncio.get_running_loop().add_reader(listen_conn.fileno(), _on_notify, app)
+        log("👂 Listening for bot jobs and catalog changes")
+    except Exception as e:
+        log(f"❌ Could not LISTEN for notifications: {e}")
+        stop_notification_listener()
+
+def stop_notification_listener():
+    """Detach and discard the LISTEN connection (it's never handed back to the pool for reuse)."""
+    global listen_conn
+    if listen_conn is None:
+        return
+    try:
+        asyncio.get_running_loop().remove_reader(listen_conn.fileno())
+    except Exception:
+        pass
+    try:
+        connection_pool.putconn(listen_conn, close=True)
+    except Exception:
+        pass
+    listen_conn = None
+
+async def bot_jobs_sweep(app):
+    """Restart a dropped listener and pick up jobs whose NOTIFY was missed."""
+    start_notification_listener(app)
+    await process_bot_jobs(app)
 
 async def runner():
     """Main runner function."""
-    global main_loop
-    main_loop = asyncio.get_running_loop()
-    
     # Initialize database
     init_connection_pool()
     init_db()
     
+    # Shared FWGS HTTP client (lives for the whole process)
+    init_http_session()
+    
+    log(f"🎭 Starting in {BOT_ROLE} role")
+    serve_telegram = BOT_ROLE in ("all", "bot")   # Command handlers + polling
+    run_worker = BOT_ROLE in ("all", "worker")    # Monitors, inventory and scheduled jobs
+    
+    # Resident catalog/state for the monitors
+    if run_worker:
+        load_monitor_state()
+    
     # Build application
     app = ApplicationBuilder().token(BOT_TOKEN).build()
     log("✅ App built successfully")
 
     app.add_error_handler(error_handler)
     
-    # Initialize app
+    # Initialize app (the worker role still needs app.bot for alerts and app.job_queue)
     await app.initialize()
     
-    # Register handlers
+    if serve_telegram:
+        register_handlers(app)
+    
+    # Start app
+    await app.start()
+    
+    scheduler = None
+    if run_worker:
+        scheduler = await start_worker_jobs(app)
+    
+    # Start polling - exactly one process per bot token may do this
+    if serve_telegram:
+        log("🤖 Bot is running with scheduler active..." if run_worker else "🤖 Bot front end is running (jobs run in the worker)...")
+        await app.updater.start_polling(error_callback=polling_error_callback)
+    else:
+        log("⚙️ Worker is running (Telegram updates are handled by the bot role)...")
+    
+    try:
+        # Keep running until interrupted
+        await asyncio.Event().wait()
+    except (KeyboardInterrupt, SystemExit):
+        log("🛑 Bot stopped manually")
+    finally:
+        # Cleanup
+        if scheduler:
+            scheduler.shutdown()  # Add scheduler shutdown
+        await stop_supervised_jobs()
+        await finish_monitor_alerts()
+        stop_notification_listener()
+        if app.updater.running:
+            await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+        await close_http_session()
+        if run_worker:
+            flush_state_writes(force=True)  # Persist buffered monitor states before the pool goes away
+            release_leadership()
+            if SHARDED_MONITOR:
+                deregister_shard_worker()
+        close_pool()
+        log("✅ Bot shutdown complete")
+
+def register_handlers(app):
+    """Telegram command and message handlers (bot role)."""
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("add", add_product))
     app.add_handler(CommandHandler("remove", remove_product))
@@ -3784,51 +5789,87 @@ async def runner():
     app.add_handler(CommandHandler("sendallwatchlist", sendallwatchlist_handler))
     app.add_handler(CommandHandler("removeglobal", removeglobal_handler))
     app.add_handler(CommandHandler("cloneglobal", cloneglobal_with_confirm_handler))
+    app.add_handler(CommandHandler("monitorstats", monitorstats_handler))
+    app.add_handler(CommandHandler("jobstats", jobstats_handler))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     log("✅ Handlers registered")
-    
-    # Start app
-    await app.start()
-    
+
+async def start_worker_jobs(app):
+    """
+    Leader election, monitor/inventory/report jobs and the bot_jobs listener (worker role).
+    Returns: the started scheduler
+    """
     # CREATE SCHEDULER FIRST (moved from below)
     scheduler = AsyncIOScheduler(job_defaults={"misfire_grace_time": 60})
     log("✅ Scheduler created")
     
-    # NOW add jobs to scheduler
+    # Leader election - only the lock holder runs the jobs below; standbys keep trying
+    if check_leadership():
+        log(f"👑 {REPLICA_ID} is the leader - running scheduled jobs")
+    else:
+        log(f"⏸️ {REPLICA_ID} is a standby - another replica runs scheduled jobs")
     scheduler.add_job(
-        lambda: schedule_coroutine(active_monitor, app),  # Wrap in lambda like the other job
+        supervise(leader_heartbeat, budget=LEADER_HEARTBEAT_SECONDS * 2, leader_only=False).fire,
         'interval',
-        seconds=30,
+        seconds=LEADER_HEARTBEAT_SECONDS,
         max_instances=1,
-        misfire_grace_time=30,
         coalesce=True
     )
-    log("✅ Active monitor job added")
     
+    # Sharded mode: every replica monitors its own partition (not just the leader)
+    if SHARDED_MONITOR:
+        await shard_heartbeat()
+        scheduler.add_job(
+            supervise(shard_heartbeat, budget=SHARD_HEARTBEAT_SECONDS * 2, leader_only=False).fire,
+            'interval',
+            seconds=SHARD_HEARTBEAT_SECONDS,
+            max_instances=1,
+            coalesce=True
+        )
+    
+    # NOW add jobs to scheduler - the supervisor (not APScheduler) keeps each job single-flight,
+    # since fire() returns as soon as the run has been started
+    monitor_job = supervise(active_monitor, budget=60, interval=MONITOR_TICK_SECONDS, leader_only=not SHARDED_MONITOR)
     scheduler.add_job(
-        lambda: schedule_coroutine(category_monitor, app),  # Wrap in lambda
+        monitor_job.fire,
         'interval',
-        minutes=5,
+        seconds=MONITOR_TICK_SECONDS,
+        args=[app],
         max_instances=1,
-        misfire_grace_time=60,
+        misfire_grace_time=MONITOR_TICK_SECONDS,
         coalesce=True
     )
-    log("✅ Category monitor job added")
+    log("✅ Active + category monitor job added")
     
+    refresh_job = supervise(refresh_global_list, budget=2 * 60 * 60, interval=24 * 60 * 60)
     scheduler.add_job(
-        lambda: schedule_coroutine(refresh_global_list, app),
+        refresh_job.fire,
         trigger="cron",
         hour=14,
         minute=0,
+        args=[app],
     )
     log("✅ Daily refresh job added")
     
+    # Requests from the bot role arrive by NOTIFY; the sweep covers missed ones and reconnects
+    start_notification_listener(app)
+    scheduler.add_job(
+        supervise(bot_jobs_sweep, budget=BOT_JOBS_SWEEP_SECONDS, leader_only=False).fire,
+        'interval',
+        seconds=BOT_JOBS_SWEEP_SECONDS,
+        args=[app],
+        max_instances=1,
+        coalesce=True
+    )
+    
     # Start scheduler
     scheduler.start()
     log("⏰ Scheduler started and attached to main event loop")
     
     # JobQueue tasks (these use Telegram's built-in job queue)
-    app.job_queue.run_repeating(inventory_refresh_job, interval=1800, first=10)
+    # An overrunning sweep is followed by one more right away instead of losing the interval
+    inventory_job = supervise(inventory_refresh_job, budget=25 * 60, interval=1800, overrun="queue")
+    app.job_queue.run_repeating(inventory_job.fire, interval=1800, first=10)
     
 ##    import warnings
 ##    from telegram.warnings import PTBUserWarning
@@ -3836,28 +5877,18 @@ async def runner():
     
     # Daily subscription check (Midnight)
     app.job_queue.run_daily(
-        check_expired_subscriptions,
+        supervise(check_expired_subscriptions, budget=10 * 60, interval=24 * 60 * 60).fire,
         time=time(hour=5, minute=0),
         days=(0, 1, 2, 3, 4, 5, 6)
     )
     
-    # Start polling
-    log("🤖 Bot is running with scheduler active...")
-    await app.updater.start_polling()
-    
-    try:
-        # Keep running until interrupted
-        await asyncio.Event().wait()
-    except (KeyboardInterrupt, SystemExit):
-        log("🛑 Bot stopped manually")
-    finally:
-        # Cleanup
-        scheduler.shutdown()  # Add scheduler shutdown
-        await app.updater.stop()
-        await app.stop()
-        await app.shutdown()
-        close_pool()
-        log("✅ Bot shutdown complete")
+    # Daily change-history retention (the change model only reads CHANGE_HISTORY_DAYS)
+    app.job_queue.run_daily(
+        supervise(prune_change_log_job, budget=10 * 60, interval=24 * 60 * 60).fire,
+        time=time(hour=5, minute=30),
+        days=(0, 1, 2, 3, 4, 5, 6)
+    )
+    return scheduler
 
 # ============================================================
 # ENTRY POINT